@@ -1,7 +1,7 @@
+import os
 import sys
-from io import BytesIO
 
-from PySide6.QtCore import Qt, Slot, QSize
+from PySide6.QtCore import Qt, Slot, Signal, QSize, QObject, QRunnable, QThreadPool
 from PySide6.QtGui import QPixmap, QImage, QMovie, QFontDatabase, QFont
 from PySide6.QtWidgets import (
     QApplication,
@@ -15,74 +15,286 @@ from PySide6.QtWidgets import (
     QFileDialog,
     QGroupBox,
     QLineEdit,
+    QComboBox,
 )
-from PIL import Image
 
 from __feature__ import snake_case, true_property
 
+from pixelart_core import (
+    RenderCancelled,
+    StageCache,
+    StageTimer,
+    apply_pixel_art_draft,
+    apply_pixel_art_pipeline,
+    PREVIEW_PYRAMID_SIZES,
+    build_preview_pyramid,
+    load_preview_source,
+    palette_artifact,
+    pick_pyramid_level,
+)
+from pixelart_animation import convert_animation, is_animated
+from pixelart_export import export_pixel_art_from_file
+from pixelart_palette import FixedPalette
 
-# Image processing helpers
 
-def pixelate(image, target_size):
-    #Creates a pixelated image using LANCZOS and NEAREST resampling.
-    orig_width, orig_height = image.size
+# Pillow -> Qt bridge
 
-    # Clamp target_size so we don't go larger than the image itself
-    min_dim = min(orig_width, orig_height)
-    target_size = max(1, min(target_size, min_dim))
+# Pillow modes that map straight onto a QImage format without conversion
+_QIMAGE_FORMATS = {
+    "RGB": (QImage.Format.Format_RGB888, 3),
+    "RGBA": (QImage.Format.Format_RGBA8888, 4),
+    "L": (QImage.Format.Format_Grayscale8, 1),
+    "P": (QImage.Format.Format_Indexed8, 1),
+}
 
-    small_img = image.resize((target_size, target_size), resample=Image.Resampling.LANCZOS)
-    pixel_art_img = small_img.resize((orig_width, orig_height), resample=Image.Resampling.NEAREST)
-    return pixel_art_img
 
+def pil_to_qimage(image):
+    #Wraps the raw pixel bytes of a Pillow image in a QImage, no PNG round-trip.
+    #Returns (qimage, buffer): the QImage only points at buffer, so the caller
+    #must keep buffer alive until the QImage has been copied into a pixmap.
+    if image.mode not in _QIMAGE_FORMATS:
+        image = image.convert("RGB")
 
-def color_pal_reduce(image, target_colors):
-    #Reduces the color palette of an image to a specified number of colors.
-    target_colors = max(2, min(target_colors, 256))
-    quantized_img = image.quantize(
-        colors=target_colors,
-        method=Image.ADAPTIVE,
-        dither=Image.Dither.FLOYDSTEINBERG,
-    )
-    return quantized_img.convert("RGB")
+    qformat, bytes_per_pixel = _QIMAGE_FORMATS[image.mode]
+    width, height = image.size
+    buffer = image.tobytes()
 
+    qimage = QImage(buffer, width, height, width * bytes_per_pixel, qformat)
 
-def color_bit_reduce(image, target_bits):
-    #Reduces color depth of an image to a specified number of bits per channel.
-    target_bits = max(1, min(target_bits, 8))
+    if image.mode == "P":
+        palette = image.getpalette() or []
+        qimage.set_color_table([
+            0xFF000000 | (palette[i] << 16) | (palette[i + 1] << 8) | palette[i + 2]
+            for i in range(0, len(palette) - 2, 3)
+        ])
 
-    width, height = image.size
+    return qimage, buffer
 
-    bitmask = 0
-    bitset = 128  # 0x80
-    for _ in range(target_bits):
-        bitmask |= bitset
-        bitset >>= 1
 
-    image = image.convert("RGB")
-    pixels = image.load()
+# Background preview rendering
 
-    for y in range(height):
-        for x in range(width):
-            r, g, b = pixels[x, y]
-            r &= bitmask
-            g &= bitmask
-            b &= bitmask
-            pixels[x, y] = r, g, b
+class _RenderSignals(QObject):
+    # Emitted from the pool thread, delivered on the GUI thread
+    drafted = Signal(int, object, object, object)
+    finished = Signal(int, object, object, object)
+    failed = Signal(int, str)
 
-    return image
 
+class _PreviewRenderJob(QRunnable):
+    def __init__(self, generation, src_image, params, signals, should_cancel, cache,
+                 draft=False):
+        super().__init__()
+        self.generation = generation
+        self.src_image = src_image
+        self.params = params
+        self.signals = signals
+        self.should_cancel = should_cancel
+        self.cache = cache
+        self.draft = draft
+
+    def _timer(self, event):
+        # The GUI thread adds its display stages before publishing
+        return StageTimer(
+            event,
+            size=self.src_image.size,
+            pixel_size=self.params.get("pixel_size"),
+            palette_colors=self.params.get("palette_colors"),
+            bit_depth=self.params.get("bit_depth"),
+        )
+
+    def run(self):
+        if self.draft:
+            self._run_draft()
+            return
 
-def apply_pixel_art_pipeline(src_image, pixel_size, palette_colors, bit_depth):
-    #Run the full pixel-art pipeline on a given Pillow image
-    img = pixelate(src_image, pixel_size)
-    img = color_pal_reduce(img, palette_colors)
-    img = color_bit_reduce(img, bit_depth)
-    return img
+        timer = self._timer("preview")
+        try:
+            # The preview keeps the small grid; Qt does the NEAREST upscale
+            image = apply_pixel_art_pipeline(
+                self.src_image,
+                should_cancel=self.should_cancel, cache=self.cache,
+                on_grid=True, upscale=False, timer=timer, **self.params,
+            )
+        except RenderCancelled:
+            image = None
+        except Exception as exc:
+            self.signals.failed.emit(self.generation, str(exc))
+            return
+        self.signals.finished.emit(self.generation, image, self.params, timer)
+
+    def _run_draft(self):
+        if self.should_cancel():
+            return
+        timer = self._timer("draft")
+        try:
+            image = apply_pixel_art_draft(self.src_image, timer=timer, **self.params)
+        except Exception:
+            # The full pass reports the same failure
+            return
+        self.signals.drafted.emit(self.generation, image, self.params, timer)
+
+
+class PreviewRenderer(QObject):
+    #Renders previews on a worker thread with latest-wins semantics: at most one
+    #render runs and one waits; a newer request replaces the waiting one and
+    #cancels the running one at its next stage boundary.
+    #Rendering is progressive: when a request changes a setting that reruns the
+    #slow stages, a cheap draft (see apply_pixel_art_draft) is rendered on a
+    #second thread and emitted through drafted, usually while the previous full
+    #pass is still winding down. The full-quality result follows through
+    #rendered; a superseded full pass is cancelled and never shown, and a draft
+    #that arrives after its full pass is dropped.
+    drafted = Signal(object, object, object)
+    rendered = Signal(object, object, object)
+    render_failed = Signal(str)
+
+    # Changing one of these reruns resample, palette tree or dithering; the
+    # palette size and bit depth only touch cheap cached stages
+    DRAFT_PARAMS = (
+        "pixel_size", "kernel", "aspect", "quantizer", "dither", "fixed_palette",
+    )
+
+    def __init__(self, parent=None, cache=None):
+        super().__init__(parent)
+        self.cache = cache
+        self._pool = QThreadPool(self)
+        self._pool.max_thread_count = 1
+        self._draft_pool = QThreadPool(self)
+        self._draft_pool.max_thread_count = 1
+
+        self._signals = _RenderSignals(self)
+        self._signals.drafted.connect(self._on_job_drafted)
+        self._signals.finished.connect(self._on_job_finished)
+        self._signals.failed.connect(self._on_job_failed)
+
+        self._generation = 0
+        self._running = False
+        self._pending = None
+        self._last_request = None
+        self._finished_generation = 0
+
+    def request(self, src_image, params):
+        #Queue a snapshot of (image, pipeline keyword args); older unstarted
+        #requests are dropped
+        params = dict(params)
+        self._generation += 1
+        if self.needs_draft(src_image, params):
+            self._start_draft(self._generation, src_image, params)
+        self._last_request = (src_image, params)
+        self._pending = (self._generation, src_image, params)
+        if not self._running:
+            self._start_pending()
+
+    def needs_draft(self, src_image, params):
+        #Whether the full render would be slow enough to show a draft first
+        if self.cache is None or self._last_request is None:
+            return True
+        last_image, last_params = self._last_request
+        return last_image is not src_image or any(
+            params.get(name) != last_params.get(name) for name in self.DRAFT_PARAMS
+        )
+
+    def is_stale(self, generation):
+        return generation != self._generation
+
+    def wait_for_done(self):
+        self._draft_pool.wait_for_done()
+        self._pool.wait_for_done()
+
+    def _start_draft(self, generation, src_image, params):
+        # Drafts that haven't started yet are already out of date
+        self._draft_pool.clear()
+        self._draft_pool.start(_PreviewRenderJob(
+            generation, src_image, params, self._signals,
+            lambda: self.is_stale(generation), None, draft=True,
+        ))
+
+    def _start_pending(self):
+        generation, src_image, params = self._pending
+        self._pending = None
+        self._running = True
+        job = _PreviewRenderJob(
+            generation, src_image, params, self._signals,
+            lambda: self.is_stale(generation), self.cache,
+        )
+        self._pool.start(job)
+
+    def _job_done(self):
+        self._running = False
+        if self._pending is not None:
+            self._start_pending()
+
+    @Slot(int, object, object, object)
+    def _on_job_drafted(self, generation, image, params, timer):
+        if not self.is_stale(generation) and generation != self._finished_generation:
+            self.drafted.emit(image, params, timer)
+
+    @Slot(int, object, object, object)
+    def _on_job_finished(self, generation, image, params, timer):
+        if image is not None and not self.is_stale(generation):
+            self._finished_generation = generation
+            self.rendered.emit(image, params, timer)
+        self._job_done()
+
+    @Slot(int, str)
+    def _on_job_failed(self, generation, message):
+        if not self.is_stale(generation):
+            self.render_failed.emit(message)
+        self._job_done()
 
 
 # Main Window / UI
 
+# (label, pipeline dither mode) for the Dithering drop-down
+DITHER_CHOICES = (
+    ("None", "none"),
+    ("Floyd-Steinberg", "floyd-steinberg"),
+    ("Bayer 2x2", "bayer2"),
+    ("Bayer 4x4", "bayer4"),
+    ("Bayer 8x8", "bayer8"),
+    ("Blue noise", "blue-noise"),
+)
+
+# (label, color_bit_reduce rounding mode) for the Bit rounding drop-down
+BIT_ROUNDING_CHOICES = (
+    ("Truncate", "truncate"),
+    ("Round to nearest", "round"),
+)
+
+# (label, pipeline pixelation kernel) for the Kernel drop-down
+KERNEL_CHOICES = (
+    ("Lanczos", "lanczos"),
+    ("Box average", "box"),
+    ("Median", "median"),
+)
+
+# (label, pipeline grid aspect) for the Grid drop-down
+ASPECT_CHOICES = (
+    ("Square", "square"),
+    ("Keep aspect", "preserve"),
+)
+
+# (label, built-in fixed palette name) for the Palette drop-down
+PALETTE_CHOICES = (
+    ("PICO-8", "pico-8"),
+    ("Game Boy", "game-boy"),
+    ("NES", "nes"),
+)
+
+# Combo data of the entry that opens a palette file
+LOAD_PALETTE_FILE = "load-file"
+
+# Combo data of the adaptive palette refined with k-means
+REFINED_PALETTE = "refined"
+
+# (label, pixelart_export preset) for the export drop-down
+EXPORT_PRESET_CHOICES = (
+    ("Fast", "fast"),
+    ("Balanced", "balanced"),
+    ("Smallest file", "smallest"),
+)
+
+
 class PixelArtCreator(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -101,11 +313,30 @@ class PixelArtCreator(QMainWindow):
         self.set_window_title(self.title)
         self.resize(800, 600)
 
-        # Full-resolution and preview images
-        self.original_image_full = None
+        # Source file and its full size; the full-resolution image is never
+        # decoded, previews and exports work from reduced decodes
+        self.source_file = None
+        self.source_size = None
+
+        # Downscaled preview levels (smallest first) and the level the current
+        # preview is rendered from
+        self.preview_pyramid = []
         self.preview_base_image = None
         self.current_image = None
 
+        # Raw bytes backing the QImage of the current preview
+        self._preview_buffer = None
+
+        # Intermediate preview stages, reused while only downstream sliders move
+        self.stage_cache = StageCache()
+
+        # Preview renders run off the GUI thread; only the newest result is shown
+        self.preview_renderer = PreviewRenderer(self, cache=self.stage_cache)
+        self.preview_renderer.drafted.connect(self.show_preview)
+        self.preview_renderer.rendered.connect(self.show_preview)
+        self.preview_renderer.rendered.connect(self.keep_preview_palette)
+        self.preview_renderer.render_failed.connect(self.show_preview_error)
+
         # Central widget + main layout
         central_widget = QWidget()
         self.set_central_widget(central_widget)
@@ -308,6 +539,76 @@ class PixelArtCreator(QMainWindow):
 
         right_controls_layout.add_layout(bitdepth_layout)
 
+        bit_rounding_label = QLabel("Bit rounding:")
+        bit_rounding_label.style_sheet = """
+            QLabel {
+                font-weight: bold;
+                font-family: 'Roboto Slab';
+            }
+        """
+
+        self.bit_rounding_combo = QComboBox()
+        self.bit_rounding_combo.style_sheet = "QComboBox { font-family: 'Roboto Slab'; }"
+        for text, rounding in BIT_ROUNDING_CHOICES:
+            self.bit_rounding_combo.add_item(text, rounding)
+        self.bit_rounding_combo.currentIndexChanged.connect(self.update_preview)
+
+        right_controls_layout.add_widget(bit_rounding_label)
+        right_controls_layout.add_widget(self.bit_rounding_combo)
+
+        # DITHERING controls
+        dither_label = QLabel("Dithering:")
+        dither_label.style_sheet = """
+            QLabel {
+                font-weight: bold;
+                font-family: 'Roboto Slab';
+            }
+        """
+
+        self.dither_combo = QComboBox()
+        self.dither_combo.style_sheet = "QComboBox { font-family: 'Roboto Slab'; }"
+        for text, mode in DITHER_CHOICES:
+            self.dither_combo.add_item(text, mode)
+        self.dither_combo.currentIndexChanged.connect(self.update_preview)
+
+        right_controls_layout.add_widget(dither_label)
+        right_controls_layout.add_widget(self.dither_combo)
+
+        # KERNEL and GRID controls
+        kernel_label = QLabel("Kernel:")
+        kernel_label.style_sheet = """
+            QLabel {
+                font-weight: bold;
+                font-family: 'Roboto Slab';
+            }
+        """
+
+        self.kernel_combo = QComboBox()
+        self.kernel_combo.style_sheet = "QComboBox { font-family: 'Roboto Slab'; }"
+        for text, kernel in KERNEL_CHOICES:
+            self.kernel_combo.add_item(text, kernel)
+        self.kernel_combo.currentIndexChanged.connect(self.update_preview)
+
+        right_controls_layout.add_widget(kernel_label)
+        right_controls_layout.add_widget(self.kernel_combo)
+
+        aspect_label = QLabel("Grid:")
+        aspect_label.style_sheet = """
+            QLabel {
+                font-weight: bold;
+                font-family: 'Roboto Slab';
+            }
+        """
+
+        self.aspect_combo = QComboBox()
+        self.aspect_combo.style_sheet = "QComboBox { font-family: 'Roboto Slab'; }"
+        for text, aspect in ASPECT_CHOICES:
+            self.aspect_combo.add_item(text, aspect)
+        self.aspect_combo.currentIndexChanged.connect(self.update_preview)
+
+        right_controls_layout.add_widget(aspect_label)
+        right_controls_layout.add_widget(self.aspect_combo)
+
         # Add right controls to middle layout
         middle_layout.add_widget(right_controls_group)
         main_layout.add_layout(middle_layout)
@@ -366,6 +667,22 @@ class PixelArtCreator(QMainWindow):
             )
         )
 
+        # Adaptive palette, or a fixed console / file palette
+        self.fixed_palette = None
+        self.quantizer = "tree"
+        # Palette of the last full-quality preview, reused by save_image
+        self.preview_palette = None
+        self.palette_mode_combo = QComboBox()
+        self.palette_mode_combo.style_sheet = "QComboBox { font-family: 'Roboto Slab'; }"
+        self.palette_mode_combo.add_item("Adaptive", None)
+        self.palette_mode_combo.add_item("Adaptive (k-means)", REFINED_PALETTE)
+        for text, name in PALETTE_CHOICES:
+            self.palette_mode_combo.add_item(text, FixedPalette.from_name(name))
+        self.palette_mode_combo.add_item("Load palette file...", LOAD_PALETTE_FILE)
+        self._palette_mode_index = 0
+        self.palette_mode_combo.currentIndexChanged.connect(self.change_palette_mode)
+
+        palette_layout.add_widget(self.palette_mode_combo)
         palette_layout.add_widget(palette_label)
         palette_layout.add_widget(self.palette_left_button)
         palette_layout.add_widget(self.palette_slider)
@@ -404,7 +721,28 @@ class PixelArtCreator(QMainWindow):
 
         self.save_button.clicked.connect(self.save_image)
         self.save_button.enabled = False  # will be set True in load_image()
-        main_layout.add_widget(self.save_button)
+
+        # Encoder preset: speed vs file size of the saved image
+        self.export_preset_combo = QComboBox()
+        self.export_preset_combo.style_sheet = "QComboBox { font-family: 'Roboto Slab'; }"
+        for text, preset in EXPORT_PRESET_CHOICES:
+            self.export_preset_combo.add_item(text, preset)
+        self.export_preset_combo.current_index = 1
+
+        # Writes the previewed palette as a file batch runs can map onto
+        self.save_palette_button = QPushButton("Save Palette")
+        self.save_palette_button.style_sheet = self.load_button.style_sheet
+        self.save_palette_button.clicked.connect(self.save_palette)
+        self.save_palette_button.enabled = False  # set True by keep_preview_palette()
+
+        save_layout = QHBoxLayout()
+        save_layout.add_widget(self.save_button, stretch=1)
+        save_layout.add_widget(self.export_preset_combo)
+        save_layout.add_widget(self.save_palette_button)
+        main_layout.add_layout(save_layout)
+
+        # Status bar: per-stage preview timings
+        self.status_bar().style_sheet = "QStatusBar { font-family: 'Roboto Slab'; }"
 
     # ---------------- Slots & helpers ----------------
 
@@ -415,30 +753,34 @@ class PixelArtCreator(QMainWindow):
             self,
             "Open Image",
             "",
-            "Image Files (*.png *.jpg *.jpeg *.bmp)",
+            "Image Files (*.png *.jpg *.jpeg *.bmp *.gif *.webp)",
         )
 
         if not file_name:
             return
 
-        # Load full-resolution image (for final save)
-        self.original_image_full = Image.open(file_name).convert("RGB")
-
-        # Make a smaller copy for fast preview
-        max_dim = 512  # you can tweak this
-        w, h = self.original_image_full.size
-        scale = min(1.0, max_dim / max(w, h))
-        if scale < 1.0:
-            new_size = (int(w * scale), int(h * scale))
-            self.preview_base_image = self.original_image_full.resize(
-                new_size, resample=Image.Resampling.LANCZOS
-            )
-        else:
-            self.preview_base_image = self.original_image_full.copy()
+        # Decode only what the preview needs
+        self.source_file = file_name
+        self.load_preview_pyramid()
+
+        # Entries for the previous image can never hit again
+        self.stage_cache.clear()
+        self.preview_palette = None
 
         self.save_button.enabled = True
         self.update_preview()
 
+    def load_preview_pyramid(self):
+        #Decodes the source just large enough for the label (JPEG DCT scaling)
+        #and builds the preview pyramid from it; update_preview picks a level
+        image, self.source_size = load_preview_source(
+            self.source_file,
+            self.preview_long_side(),
+            min_side=self.pixelation_slider.maximum,
+        )
+        self.preview_pyramid = build_preview_pyramid(image)
+        self.preview_base_image = None
+
     def increment_slider(self, slider, direction):
         #Increment or decrement a slider's value by the specified direction
         new_value = slider.value + direction
@@ -461,7 +803,7 @@ class PixelArtCreator(QMainWindow):
     @Slot()
     def update_preview(self):
         #Rebuild the pixel-art preview when any control changes
-        if self.preview_base_image is None:
+        if not self.preview_pyramid:
             self.image_label.text = "Load an image to see the preview."
             return
 
@@ -478,63 +820,238 @@ class PixelArtCreator(QMainWindow):
         self.palette_input.text = str(palette_colors)
         self.bitdepth_input.text = str(bit_depth)
 
-        # Run pipeline on the *small* preview image
-        processed_image = apply_pixel_art_pipeline(
-            self.preview_base_image,
-            pixel_size,
-            palette_colors,
-            bit_depth,
+        # Run pipeline on the smallest pyramid level that fills the label, in
+        # the background
+        self.preview_base_image = self.preview_level()
+        self.preview_renderer.request(self.preview_base_image, self.pipeline_settings())
+
+    def preview_long_side(self):
+        #Longer side of the label in device pixels, capped to what the pyramid
+        #and the source can provide
+        label_size = self.image_label.size
+        long_side = max(label_size.width(), label_size.height())
+        long_side *= self.image_label.device_pixel_ratio_f()
+        limit = max(PREVIEW_PYRAMID_SIZES)
+        if self.source_size is not None:
+            limit = min(limit, max(self.source_size))
+        return min(long_side, limit)
+
+    def preview_level(self):
+        #Pyramid level covering the label in device pixels and the pixel size
+        return pick_pyramid_level(
+            self.preview_pyramid,
+            self.preview_long_side(),
+            min_side=self.pixelation_slider.value,
         )
 
-        self.current_image = processed_image
+    def resize_event(self, event):
+        super().resize_event(event)
+        if not self.preview_pyramid:
+            return
+        # The label outgrew the decoded preview source: decode a larger one
+        if max(self.preview_pyramid[-1].size) < self.preview_long_side():
+            self.load_preview_pyramid()
+        # A bigger label may need a sharper pyramid level, a smaller one a
+        # cheaper level
+        if self.preview_level() is not self.preview_base_image:
+            self.update_preview()
+
+    def pipeline_settings(self):
+        #Current control values as apply_pixel_art_pipeline keyword arguments.
+        #The palette tree makes palette-slider scrubbing a lookup per tick; the
+        #k-means refiner a warm-started refinement per tick.
+        return {
+            "pixel_size": self.pixelation_slider.value,
+            "palette_colors": self.palette_slider.value,
+            "bit_depth": self.bitdepth_slider.value,
+            "bit_rounding": self.bit_rounding_combo.current_data(),
+            "kernel": self.kernel_combo.current_data(),
+            "aspect": self.aspect_combo.current_data(),
+            "quantizer": self.quantizer,
+            "dither": self.dither_combo.current_data(),
+            "fixed_palette": self.fixed_palette,
+        }
 
-        # Convert Pillow image -> QPixmap
-        buffer = BytesIO()
-        processed_image.save(buffer, format="PNG")
-        buffer.seek(0)
+    @Slot()
+    def change_palette_mode(self):
+        #Switch between the adaptive palette and a fixed one (built-in or file)
+        choice = self.palette_mode_combo.current_data()
+
+        if choice == LOAD_PALETTE_FILE:
+            choice = self.load_palette_file()
+            if choice is None:
+                # Cancelled or unreadable: go back to the previous entry
+                self.palette_mode_combo.block_signals(True)
+                self.palette_mode_combo.current_index = self._palette_mode_index
+                self.palette_mode_combo.block_signals(False)
+                return
+            index = self.palette_mode_combo.count - 1
+            self.palette_mode_combo.block_signals(True)
+            self.palette_mode_combo.insert_item(index, choice.name, choice)
+            self.palette_mode_combo.current_index = index
+            self.palette_mode_combo.block_signals(False)
+
+        self._palette_mode_index = self.palette_mode_combo.current_index
+        # The refined entry is still adaptive, with the k-means quantizer
+        self.quantizer = "kmeans" if choice == REFINED_PALETTE else "tree"
+        if choice == REFINED_PALETTE:
+            choice = None
+        self.fixed_palette = choice
+
+        # The color count only applies to adaptive palettes
+        adaptive = choice is None
+        self.palette_slider.enabled = adaptive
+        self.palette_left_button.enabled = adaptive
+        self.palette_right_button.enabled = adaptive
+        self.palette_input.enabled = adaptive
 
-        qimage = QImage()
-        qimage.load_from_data(buffer.read())
-        if qimage.is_null():
-            self.image_label.text = "Error loading preview."
-            return
+        self.update_preview()
+
+    def load_palette_file(self):
+        #Ask for a palette file; returns a FixedPalette or None
+        file_name, _ = QFileDialog.get_open_file_name(
+            self,
+            "Open Palette",
+            "",
+            "Palette Files (*.hex *.gpl *.pal *.txt *.json)",
+        )
+        if not file_name:
+            return None
 
-        pixmap = QPixmap.from_image(qimage)
+        try:
+            return FixedPalette.from_file(file_name)
+        except (OSError, ValueError) as exc:
+            print(f"Could not load palette: {exc}")
+            return None
+
+    @Slot(object, object, object)
+    def show_preview(self, processed_image, params, timer):
+        #Display the newest finished render from the preview worker, draft or
+        #full quality
+        self.current_image = processed_image
 
-        scaled_pixmap = pixmap.scaled(
-            self.image_label.size,
-            Qt.KeepAspectRatio,
-            Qt.SmoothTransformation,
+        # Convert Pillow image -> QPixmap (direct buffer wrap, no encoding)
+        with timer.stage("to_qimage"):
+            qimage, self._preview_buffer = pil_to_qimage(processed_image)
+            if qimage.is_null():
+                self.image_label.text = "Error loading preview."
+                return
+
+            pixmap = QPixmap.from_image(qimage)
+
+        # The grid is square; stretch it back to the source's aspect ratio with
+        # hard pixel edges, which is the final upscale step of the pipeline.
+        # Scaling to device pixels keeps block edges crisp on HiDPI screens.
+        with timer.stage("scale"):
+            ratio = self.image_label.device_pixel_ratio_f()
+            base_width, base_height = self.source_size
+            display_size = QSize(base_width, base_height).scaled(
+                self.image_label.size * ratio, Qt.KeepAspectRatio
+            )
+            scaled_pixmap = pixmap.scaled(
+                display_size,
+                Qt.IgnoreAspectRatio,
+                Qt.FastTransformation,
+            )
+            scaled_pixmap.set_device_pixel_ratio(ratio)
+            self.image_label.pixmap = scaled_pixmap
+
+        self.show_timings(timer.publish())
+
+    def show_timings(self, record):
+        #Per-stage durations of the last preview or draft in the status bar
+        stages = "  ".join(
+            f"{name} {seconds * 1000:.1f}" for name, seconds in record["stages"].items()
+        )
+        self.status_bar().show_message(
+            f"{record['event'].capitalize()} {record['total'] * 1000:.1f} ms  |  {stages} (ms)"
         )
-        self.image_label.pixmap = scaled_pixmap
+
+    @Slot(object, object, object)
+    def keep_preview_palette(self, processed_image, params, timer):
+        #Remember the palette of each full-quality preview, with the settings
+        #that made it, so save_image can export with exactly these colors
+        name = None
+        if self.source_file is not None:
+            name = os.path.splitext(os.path.basename(self.source_file))[0]
+        self.preview_palette = palette_artifact(processed_image, name=name, **params)
+        self.save_palette_button.enabled = True
+
+    def approved_palette(self):
+        #The previewed palette if the controls still match the preview it came
+        #from, otherwise None
+        settings = self.pipeline_settings()
+        if self.preview_palette is None or settings.pop("fixed_palette") is not None:
+            return None
+        if self.preview_palette.settings != settings:
+            return None
+        return self.preview_palette
+
+    @Slot(str)
+    def show_preview_error(self, message):
+        print(f"Preview failed: {message}")
+        self.image_label.text = "Error loading preview."
 
     @Slot()
     def save_image(self):
         #Allow user to save a full-resolution pixel-art image
-        if self.original_image_full is None:
+        if self.source_file is None:
             return
 
         file_name, _ = QFileDialog.get_save_file_name(
             self,
             "Save Pixel Art",
             "",
-            "PNG Files (*.png);;JPEG Files (*.jpg)",
+            "PNG Files (*.png);;WebP Files (*.webp);;GIF Files (*.gif);;JPEG Files (*.jpg)",
         )
         if not file_name:
             return
 
-        # Use full-res image for final output (can be slower, but only once)
-        pixel_size = self.pixelation_slider.value
-        palette_colors = self.palette_slider.value
-        bit_depth = self.bitdepth_slider.value
+        # Full-resolution output without a full-resolution decode: the grid is
+        # built from a reduced decode and PNGs are streamed row by row. The
+        # previewed palette is remapped onto rather than quantized again, so
+        # the file has the colors that were on screen.
+        settings = self.pipeline_settings()
+        approved = self.approved_palette()
+        if approved is not None:
+            settings["fixed_palette"] = approved
+        preset = self.export_preset_combo.current_data()
+        if file_name.lower().endswith(".gif") and is_animated(self.source_file):
+            # Every frame, mapped onto the same palette as the preview (the
+            # preview shows the first frame)
+            report = convert_animation(
+                self.source_file, file_name, preset=preset, **settings
+            )
+        else:
+            report = export_pixel_art_from_file(
+                self.source_file, file_name, preset=preset, **settings
+            )
+        self.status_bar().show_message(
+            f"Saved {report['file_name']}: {report['bytes'] / 1024:.1f} KiB, "
+            f"encoded in {report['encode_seconds'] * 1000:.1f} ms ({report['preset']})"
+        )
+
+    @Slot()
+    def save_palette(self):
+        #Save the previewed palette for pixelart_batch.py --palette
+        if self.preview_palette is None:
+            return
+
+        file_name, _ = QFileDialog.get_save_file_name(
+            self,
+            "Save Palette",
+            "",
+            "Palette Files (*.json)",
+        )
+        if not file_name:
+            return
+        if not file_name.lower().endswith(".json"):
+            file_name += ".json"
 
-        final_image = apply_pixel_art_pipeline(
-            self.original_image_full,
-            pixel_size,
-            palette_colors,
-            bit_depth,
+        self.preview_palette.save(file_name)
+        self.status_bar().show_message(
+            f"Saved {len(self.preview_palette.colors)} colors to {file_name}"
         )
-        final_image.save(file_name)
 
 
 # Run the app
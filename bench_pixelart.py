@@ -0,0 +1,349 @@
+# Benchmark suite for the pixel-art pipeline.
+#
+# Runs every stage and the full pipeline over test_images/ plus synthetic 4K
+# and 8K inputs, across a grid of pixel sizes, palette sizes and bit depths.
+# Each case runs in a fresh worker process so its peak memory can be read from
+# the process high-water mark, reset after the inputs are prepared (Linux).
+# The "import" stage times a cold import of each headless module in a new
+# interpreter, plus building its argument parser for the CLIs, to keep CLI
+# and worker startup cheap.
+#
+#   python bench_pixelart.py --save-baseline bench_baseline.json
+#   python bench_pixelart.py --compare bench_baseline.json --threshold 0.25
+
+import argparse
+import ctypes
+import gc
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from pixelart_core import (
+    apply_pixel_art_pipeline,
+    build_preview_pyramid,
+    color_bit_reduce,
+    color_pal_reduce,
+    load_preview_source,
+    pixelate,
+)
+
+
+TEST_IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_images")
+
+BUNDLED_IMAGES = ("cat1.jpg", "cat2.jpg", "wallpaper1.jpg", "freddy.jpg")
+
+SYNTHETIC_SIZES = {
+    "synthetic-4k": (3840, 2160),
+    "synthetic-8k": (7680, 4320),
+}
+
+# Parameter grids; --quick trims them to one value each
+PIXEL_SIZES = (16, 64, 256)
+PALETTE_SIZES = (8, 64, 256)
+BIT_DEPTHS = (3, 8)
+
+STAGES = (
+    "import", "load_preview", "pixelate", "color_pal_reduce", "color_bit_reduce",
+    "pipeline", "pipeline_grid",
+)
+
+# What the GUI decodes for a typical window: a 1024 px preview source whose
+# short side still fits the largest pixel size
+PREVIEW_LOAD_SIZE = (1024, 256)
+
+# Modules the batch CLI and its workers import; none of them may pull in Qt
+IMPORT_MODULES = ("pixelart_core", "pixelart_export", "pixelart_batch")
+
+# Run by a fresh interpreter; prints "<seconds> <peak RSS growth in bytes>".
+# A CLI module builds its parser too, since main() always does and choices
+# can pull in other modules.
+IMPORT_PROBE = """
+import resource, sys, time
+def peak():
+    value = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return value if sys.platform == "darwin" else value * 1024
+before = peak()
+start = time.perf_counter()
+import {module}
+if hasattr({module}, "build_arg_parser"):
+    {module}.build_arg_parser()
+seconds = time.perf_counter() - start
+print(seconds, max(0, peak() - before))
+"""
+
+
+def load_input(name):
+    #Decodes a bundled test image or builds a synthetic one
+    if name in SYNTHETIC_SIZES:
+        return synthetic_image(SYNTHETIC_SIZES[name])
+    with Image.open(os.path.join(TEST_IMAGE_DIR, name)) as src:
+        return src.convert("RGB")
+
+
+def synthetic_image(size):
+    #Smooth gradients plus noise: many distinct colors, like a photo
+    width, height = size
+    red = Image.linear_gradient("L").resize(size)
+    green = Image.linear_gradient("L").rotate(90).resize(size)
+    blue = Image.effect_noise(size, 64).point(lambda value: min(255, value))
+    return Image.merge("RGB", (red, green, blue))
+
+
+def peak_rss_bytes():
+    #Process RSS high-water mark: VmHWM where /proc has it, since only that
+    #one can be reset (see reset_peak_rss), otherwise getrusage's
+    try:
+        with open("/proc/self/status", encoding="ascii") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def reset_peak_rss():
+    #Lowers the high-water mark to the current RSS and returns it, so a stage
+    #that needs less memory than its input preparation still reports its own
+    #peak. Only Linux can do this; elsewhere the mark keeps the preparation's
+    #peak and lighter stages read as 0.
+    gc.collect()
+    try:
+        # glibc keeps large freed blocks mapped; without handing them back
+        # the stage would reuse them and the RSS would not grow
+        ctypes.CDLL(None).malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+    return peak_rss_bytes()
+
+
+def bench_import(module, repeats):
+    #Cold-imports module in a new interpreter per repeat; a forked worker would
+    #inherit everything this process has already imported
+    timings = []
+    peak_memory = 0
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE.format(module=module)],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout.split()
+        timings.append(float(output[0]))
+        peak_memory = max(peak_memory, int(output[1]))
+    return {
+        "seconds": statistics.median(timings),
+        "peak_memory_bytes": peak_memory,
+        "megapixels_per_second": None,
+    }
+
+
+def bench_load_preview(name, repeats):
+    #Time to a preview pyramid straight from the file (bundled images only)
+    path = os.path.join(TEST_IMAGE_DIR, name)
+    long_side, min_side = PREVIEW_LOAD_SIZE
+
+    baseline_rss = reset_peak_rss()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        image, full_size = load_preview_source(path, long_side, min_side)
+        build_preview_pyramid(image)
+        timings.append(time.perf_counter() - start)
+
+    seconds = statistics.median(timings)
+    megapixels = full_size[0] * full_size[1] / 1e6
+    return {
+        "seconds": seconds,
+        "peak_memory_bytes": max(0, peak_rss_bytes() - baseline_rss),
+        "megapixels_per_second": megapixels / seconds if seconds > 0 else 0.0,
+    }
+
+
+def bench_case(case, repeats):
+    #Runs one case in the current (fresh) process and returns its measurements
+    stage = case["stage"]
+    if stage == "load_preview":
+        return bench_load_preview(case["image"], repeats)
+    image = load_input(case["image"])
+    pixel_size = case.get("pixel_size", 64)
+    palette_colors = case.get("palette_colors", 64)
+    bit_depth = case.get("bit_depth", 8)
+
+    # Inputs of the later stages are what the pipeline would feed them
+    if stage == "pixelate":
+        run = lambda: pixelate(image, pixel_size)
+    elif stage == "color_pal_reduce":
+        stage_input = pixelate(image, pixel_size)
+        run = lambda: color_pal_reduce(stage_input, palette_colors)
+    elif stage == "color_bit_reduce":
+        stage_input = color_pal_reduce(pixelate(image, pixel_size), palette_colors)
+        run = lambda: color_bit_reduce(stage_input, bit_depth)
+    elif stage == "pipeline":
+        run = lambda: apply_pixel_art_pipeline(image, pixel_size, palette_colors, bit_depth)
+    elif stage == "pipeline_grid":
+        run = lambda: apply_pixel_art_pipeline(
+            image, pixel_size, palette_colors, bit_depth, on_grid=True
+        )
+    else:
+        raise ValueError(f"Unknown stage: {stage!r}")
+
+    baseline_rss = reset_peak_rss()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+
+    seconds = statistics.median(timings)
+    megapixels = image.size[0] * image.size[1] / 1e6
+    return {
+        "seconds": seconds,
+        "peak_memory_bytes": max(0, peak_rss_bytes() - baseline_rss),
+        "megapixels_per_second": megapixels / seconds if seconds > 0 else 0.0,
+    }
+
+
+def build_cases(images, quick=False):
+    #Only varies the parameters each stage actually depends on
+    pixel_sizes = PIXEL_SIZES[1:2] if quick else PIXEL_SIZES
+    palette_sizes = PALETTE_SIZES[1:2] if quick else PALETTE_SIZES
+    bit_depths = BIT_DEPTHS[:1] if quick else BIT_DEPTHS
+
+    cases = [{"stage": "import", "image": module} for module in IMPORT_MODULES]
+    for image in images:
+        if image not in SYNTHETIC_SIZES:
+            cases.append({"stage": "load_preview", "image": image})
+        for pixel_size in pixel_sizes:
+            cases.append({"stage": "pixelate", "image": image, "pixel_size": pixel_size})
+        for palette_colors in palette_sizes:
+            cases.append({"stage": "color_pal_reduce", "image": image,
+                          "palette_colors": palette_colors})
+        for bit_depth in bit_depths:
+            cases.append({"stage": "color_bit_reduce", "image": image,
+                          "bit_depth": bit_depth})
+        for stage in ("pipeline", "pipeline_grid"):
+            for pixel_size in pixel_sizes:
+                for palette_colors in palette_sizes:
+                    for bit_depth in bit_depths:
+                        cases.append({
+                            "stage": stage, "image": image, "pixel_size": pixel_size,
+                            "palette_colors": palette_colors, "bit_depth": bit_depth,
+                        })
+    return cases
+
+
+def case_key(case):
+    params = ",".join(
+        f"{name}={case[name]}"
+        for name in ("pixel_size", "palette_colors", "bit_depth")
+        if name in case
+    )
+    return f"{case['stage']}|{case['image']}|{params}"
+
+
+def run_cases(cases, repeats, log=print):
+    #Each case gets its own process so peak memory isn't inherited
+    results = {}
+    for case in cases:
+        if case["stage"] == "import":
+            result = bench_import(case["image"], repeats)
+        else:
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                result = pool.submit(bench_case, case, repeats).result()
+        key = case_key(case)
+        results[key] = result
+        throughput = result["megapixels_per_second"]
+        throughput = "" if throughput is None else f"{throughput:8.1f} MP/s"
+        log(
+            f"{result['seconds'] * 1000:9.1f} ms  "
+            f"{result['peak_memory_bytes'] / 2**20:8.1f} MiB  "
+            f"{throughput:>13}  {key}"
+        )
+    return results
+
+
+def compare_results(results, baseline, threshold):
+    #Returns a list of regression messages (empty when everything is within threshold)
+    regressions = []
+    for key, result in results.items():
+        reference = baseline.get(key)
+        if reference is None:
+            continue
+        for metric in ("seconds", "peak_memory_bytes"):
+            old, new = reference[metric], result[metric]
+            if old > 0 and new > old * (1.0 + threshold):
+                regressions.append(
+                    f"{key}: {metric} {old:.4g} -> {new:.4g} (+{(new / old - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the pixel-art pipeline.")
+    parser.add_argument("--images", nargs="+",
+                        default=list(BUNDLED_IMAGES) + list(SYNTHETIC_SIZES),
+                        help="bundled image names and/or synthetic-4k, synthetic-8k "
+                             "(import cases always run)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--repeats", type=int, default=3,
+                        help="timed runs per case; the median is kept (default: 3)")
+    parser.add_argument("--quick", action="store_true",
+                        help="one pixel size, palette size and bit depth per stage")
+    parser.add_argument("--save-baseline", metavar="JSON",
+                        help="write the results to this baseline file")
+    parser.add_argument("--compare", metavar="JSON",
+                        help="fail if a case regresses against this baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown / memory growth as a fraction (default: 0.25)")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+
+    cases = [
+        case for case in build_cases(args.images, quick=args.quick)
+        if case["stage"] in args.stages
+    ]
+    results = run_cases(cases, args.repeats)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "results": results,
+            }, baseline_file, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+        regressions = compare_results(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) past {args.threshold:.0%}:")
+            for message in regressions:
+                print(f"  {message}")
+            return 1
+        print(f"No regressions past {args.threshold:.0%}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
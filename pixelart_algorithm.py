@@ -33,26 +33,13 @@ def color_pal_reduce(image, target_colors):
 #param image: Pillow image object
 #param target_size: The number of bits per color
 def color_bit_reduce(image, target_bits):
-    width, height = image.size
+    bitmask = (0xFF << max(0, 8 - target_bits)) & 0xFF
     
-    bitmask = 0
-    bitset = 128    # 0x80
-    for b in range(target_bits):
-        bitmask = bitmask | bitset
-        bitset = bitset >> 1
+    # One 256-entry table per channel instead of masking pixel by pixel
+    lut = [value & bitmask for value in range(256)] * 3
     
     image = image.convert("RGB")
-    pixels = image.load()
-    
-    for y in range(height):
-        for x in range(width):
-            r, g, b = pixels[x, y]
-            r = r & bitmask
-            g = g & bitmask
-            b = b & bitmask
-            pixels[x, y] = r, g, b
-    
-    return image
+    return image.point(lut)
 
 
 class PixelArtCreator(QMainWindow):
@@ -187,10 +174,11 @@ class PixelArtCreator(QMainWindow):
         self.current_image.save(file_name)
 
 
-# Create application
-my_app = QApplication([])
-# Create window	
-window = PixelArtCreator()
-window.show()
-# Run Qt program
-sys.exit(my_app.exec())
\ No newline at end of file
+if __name__ == "__main__":
+    # Create application
+    my_app = QApplication([])
+    # Create window	
+    window = PixelArtCreator()
+    window.show()
+    # Run Qt program
+    sys.exit(my_app.exec())
@@ -0,0 +1,356 @@
+# Animated GIF / APNG and frame-sequence conversion with a shared palette.
+# Qt-free, like pixelart_core, and as cheap to import: Pillow, numpy and the
+# palette builders load on first use. Frames are decoded, converted and
+# written one at a time, so memory holds a few frames however long the
+# animation is.
+#
+# Example:
+#   from pixelart_animation import convert_animation
+#   convert_animation("walk.gif", "walk_pixel.gif", 64, 16, 8)
+
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from contextlib import ExitStack
+
+from pixelart_core import (
+    BIT_ROUNDING_MODES,
+    DITHER_MODES,
+    QUANTIZERS,
+    color_bit_reduce,
+    lazy_import,
+    pixelate_grid,
+    upscale_grid,
+)
+from pixelart_export import StreamingPNGWriter, export_report, png_compress_level
+
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
+GifImagePlugin = lazy_import("PIL.GifImagePlugin")
+ImageSequence = lazy_import("PIL.ImageSequence")
+
+
+# "global" builds one palette from every frame (two decoding passes);
+# "window" builds a new one every `window` frames in a single pass
+ANIMATION_PALETTES = ("global", "window")
+
+DEFAULT_PALETTE_WINDOW = 16
+
+# Used for frame sequences and for frames that carry no duration
+DEFAULT_FRAME_DURATION = 100
+
+# Output extension -> container
+ANIMATION_FORMATS = {".gif": "gif", ".png": "apng", ".apng": "apng"}
+
+
+def is_animated(file_name):
+    with Image.open(file_name) as image:
+        return getattr(image, "is_animated", False)
+
+
+def animation_format(file_name):
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension not in ANIMATION_FORMATS:
+        raise ValueError(
+            f"Animations are written as {', '.join(ANIMATION_FORMATS)}, not {extension!r}"
+        )
+    return ANIMATION_FORMATS[extension]
+
+
+def iter_frames(source, frame_duration=DEFAULT_FRAME_DURATION):
+    #Yields (RGB frame, duration in ms) one decoded frame at a time. source is
+    #an animated image file (GIF, APNG, WebP, ...) or a sequence of still
+    #image files played in order. Transparency is flattened.
+    if isinstance(source, (str, os.PathLike)):
+        with Image.open(source) as image:
+            for frame in ImageSequence.Iterator(image):
+                yield frame.convert("RGB"), frame.info.get("duration") or frame_duration
+    else:
+        for file_name in source:
+            with Image.open(file_name) as image:
+                yield image.convert("RGB"), frame_duration
+
+
+def _ordered_map(pool, function, items, ahead):
+    #pool.map that keeps at most `ahead` items in flight; Executor.map would
+    #read every frame up front
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(function, item))
+        if len(pending) >= ahead:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def animation_palette(histogram, palette_colors, quantizer="tree"):
+    #FixedPalette for the combined ColorHistogram of several frame grids.
+    #"kmeans" refines it with a PaletteRefiner; the other quantizers use the
+    #median-cut PaletteTree, since Pillow's quantize() cannot weigh colors.
+    from pixelart_palette import FixedPalette, PaletteRefiner, PaletteTree
+
+    target_colors = max(2, min(palette_colors, 256))
+    if histogram.color_count <= target_colors:
+        return FixedPalette(histogram.colors)
+    if quantizer == "kmeans":
+        return FixedPalette(PaletteRefiner(None, histogram=histogram).palette(target_colors))
+    tree = PaletteTree(None, max_colors=target_colors, histogram=histogram)
+    return FixedPalette(tree.palette(target_colors))
+
+
+class StreamingGIFWriter:
+    #Writes an animated GIF a frame at a time through Pillow's GIF encoder.
+    #Frames are P-mode images placed at an offset over the previous ones
+    #(disposal 1), so unchanged areas can be cropped away. The first frame sets
+    #the canvas and the global color table; a later frame with another palette
+    #carries its own local table.
+
+    def __init__(self, file_name, loop=0):
+        self.loop = loop
+        self.frames_written = 0
+        self._palette = None
+        self._file = open(file_name, "wb")
+
+    def write_frame(self, image, offset=(0, 0), duration=DEFAULT_FRAME_DURATION):
+        params = {"duration": duration, "disposal": 1}
+        if self._palette is None:
+            self._palette = image.getpalette()
+            header, _ = GifImagePlugin.getheader(image, info={"loop": self.loop})
+            for block in header:
+                self._file.write(block)
+        elif image.getpalette() != self._palette:
+            params["include_color_table"] = True
+
+        for block in GifImagePlugin.getdata(image, offset, **params):
+            self._file.write(block)
+        self.frames_written += 1
+
+    def close(self):
+        if self._file.closed:
+            return
+        try:
+            self._file.write(b";")
+        finally:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+
+
+class StreamingAPNGWriter(StreamingPNGWriter):
+    #Writes an indexed animated PNG a frame at a time. Every frame shares the
+    #PLTE palette and is placed at an offset, replacing what was there (blend
+    #op SOURCE, dispose op NONE). The frame count in acTL is patched in close().
+
+    def __init__(self, file_name, width, height, palette, compress_level=6, loop=0):
+        super().__init__(
+            file_name, width, height, mode="P", palette=palette,
+            compress_level=compress_level,
+        )
+        self.compress_level = compress_level
+        self.loop = loop
+        self.frames_written = 0
+        self._palette = list(palette)
+        self._sequence = 0
+        self._actl_offset = self._file.tell()
+        self._write_chunk(b"acTL", struct.pack(">II", 0, loop))
+
+    def write_frame(self, image, offset=(0, 0), duration=DEFAULT_FRAME_DURATION):
+        if image.mode != "P" or image.getpalette() != self._palette:
+            raise ValueError("APNG frames must share the writer's palette")
+        width, height = image.size
+        x, y = offset
+        covers_canvas = offset == (0, 0) and image.size == (self.width, self.height)
+        if self.frames_written == 0 and not covers_canvas:
+            raise ValueError("The first APNG frame must cover the whole canvas")
+
+        self._write_chunk(b"fcTL", struct.pack(
+            ">IIIIIHHBB", self._sequence, width, height, x, y,
+            min(int(duration), 65535), 1000, 0, 0,
+        ))
+        self._sequence += 1
+
+        raw = image.tobytes()
+        # Filter type 0 (None) in front of every row
+        filtered = b"".join(
+            b"\x00" + raw[row:row + width] for row in range(0, len(raw), width)
+        )
+        data = zlib.compress(filtered, self.compress_level)
+        if self.frames_written == 0:
+            self._write_chunk(b"IDAT", data)
+        else:
+            self._write_chunk(b"fdAT", struct.pack(">I", self._sequence) + data)
+            self._sequence += 1
+        self.frames_written += 1
+
+    def close(self):
+        if self._file.closed:
+            return
+        try:
+            if self.frames_written == 0:
+                raise ValueError("APNG needs at least one frame")
+            self._write_chunk(b"IEND", b"")
+            self._file.seek(self._actl_offset)
+            self._write_chunk(b"acTL", struct.pack(">II", self.frames_written, self.loop))
+        finally:
+            self._file.close()
+
+
+def convert_animation(source, file_name, pixel_size, palette_colors, bit_depth,
+                      palette="global", window=DEFAULT_PALETTE_WINDOW, quantizer="tree",
+                      dither="none", fixed_palette=None, kernel="lanczos",
+                      aspect="square", workers=None, preset="balanced", loop=0,
+                      frame_duration=DEFAULT_FRAME_DURATION, bit_rounding="truncate"):
+    #Converts every frame of an animation (or a frame sequence, see
+    #iter_frames) to pixel art and writes an animated GIF or APNG, chosen by
+    #file_name's extension. Arguments match apply_pixel_art_pipeline with
+    #on_grid=True; each frame is pixelated on the grid, mapped onto a shared
+    #palette and upscaled to its own size.
+    #
+    #palette="global" scans the frames once to build one palette from all of
+    #them and decodes them again to convert; "window" converts in one pass
+    #with a new palette for every `window` frames (GIF only, since APNG frames
+    #share one palette). A fixed_palette skips palette building entirely.
+    #Grids are built and mapped on a thread pool of `workers` threads while the
+    #next frames decode; ordered dithers use the same pattern in every frame,
+    #so they do not flicker.
+    #
+    #Each written frame is cropped to the blocks that changed since the
+    #previous one, and a frame with no change only extends the previous
+    #frame's duration. Returns an export_report with "frames" (source frames),
+    #"frames_written" and "seconds" added.
+    from concurrent.futures import ThreadPoolExecutor
+
+    from pixelart_palette import ColorHistogram
+
+    start = time.perf_counter()
+    output_format = animation_format(file_name)
+    if palette not in ANIMATION_PALETTES:
+        raise ValueError(f"Unknown animation palette: {palette!r}")
+    if quantizer not in QUANTIZERS:
+        raise ValueError(f"Unknown quantizer: {quantizer!r}")
+    if dither not in DITHER_MODES:
+        raise ValueError(f"Unknown dither mode: {dither!r}")
+    if bit_rounding not in BIT_ROUNDING_MODES:
+        raise ValueError(f"Unknown rounding mode: {bit_rounding!r}")
+    if output_format == "apng" and palette == "window" and fixed_palette is None:
+        raise ValueError("APNG frames share one palette; use palette='global'")
+
+    def frames():
+        return iter_frames(source, frame_duration)
+
+    def frame_grid(item):
+        frame, duration = item
+        return pixelate_grid(frame, pixel_size, kernel, aspect), frame.size, duration
+
+    def grid_histogram(item):
+        return ColorHistogram(frame_grid(item)[0])
+
+    def map_grid(grid, frame_palette):
+        return color_bit_reduce(
+            frame_palette.quantize(grid, dither), bit_depth, bit_rounding
+        )
+
+    def converted_frames(pool, ahead):
+        #(P grid, frame size, duration) for every frame, in order
+        if fixed_palette is not None or palette == "global":
+            shared = fixed_palette
+            if shared is None:
+                combined = None
+                for histogram in _ordered_map(pool, grid_histogram, frames(), ahead):
+                    combined = histogram if combined is None else ColorHistogram.combine(
+                        (combined, histogram)
+                    )
+                shared = animation_palette(combined, palette_colors, quantizer)
+
+            def convert(item):
+                grid, size, duration = frame_grid(item)
+                return map_grid(grid, shared), size, duration
+
+            yield from _ordered_map(pool, convert, frames(), ahead)
+            return
+
+        def flush(batch):
+            combined = ColorHistogram.combine(ColorHistogram(grid) for grid, _, _ in batch)
+            window_palette = animation_palette(combined, palette_colors, quantizer)
+            grids = pool.map(lambda entry: map_grid(entry[0], window_palette), batch)
+            for grid, (_, size, duration) in zip(grids, batch):
+                yield grid, size, duration
+
+        batch = []
+        for entry in _ordered_map(pool, frame_grid, frames(), ahead):
+            batch.append(entry)
+            if len(batch) == max(1, window):
+                yield from flush(batch)
+                batch = []
+        if batch:
+            yield from flush(batch)
+
+    writer = None
+    canvas = None
+    previous = None
+    pending = None
+    source_frames = 0
+    encode_seconds = 0.0
+
+    def write(frame, offset, duration):
+        nonlocal encode_seconds
+        encode_start = time.perf_counter()
+        writer.write_frame(frame, offset, duration)
+        encode_seconds += time.perf_counter() - encode_start
+
+    threads = workers or os.cpu_count() or 1
+    # The pool shuts down before the writer closes; on errors the writer
+    # closes without finishing the file
+    with ExitStack() as stack, ThreadPoolExecutor(max_workers=threads) as pool:
+        for grid, size, duration in converted_frames(pool, threads * 2):
+            source_frames += 1
+            if canvas is None:
+                canvas = size
+                if output_format == "gif":
+                    writer = StreamingGIFWriter(file_name, loop=loop)
+                else:
+                    writer = StreamingAPNGWriter(
+                        file_name, size[0], size[1], grid.getpalette(),
+                        compress_level=png_compress_level(preset), loop=loop,
+                    )
+                stack.enter_context(writer)
+            elif size != canvas:
+                raise ValueError(f"Frame size {size} differs from the first frame's {canvas}")
+
+            # Compare on the grid and map the changed cells to output pixels
+            # through the same NEAREST upscale the frame gets
+            colors = np.asarray(grid.convert("RGB"))
+            if previous is None:
+                box = (0, 0) + size
+            else:
+                changed = (colors != previous).any(axis=2).astype(np.uint8) * 255
+                box = upscale_grid(Image.fromarray(changed, "L"), size).getbbox()
+            previous = colors
+
+            if box is None:
+                pending[2] += duration
+                continue
+            if pending is not None:
+                write(*pending)
+            pending = [upscale_grid(grid, size).crop(box), box[:2], duration]
+
+        if pending is None:
+            raise ValueError("The animation has no frames")
+        write(*pending)
+
+    report = export_report(file_name, preset, encode_seconds)
+    report.update(
+        frames=source_frames,
+        frames_written=writer.frames_written,
+        seconds=time.perf_counter() - start,
+    )
+    return report
@@ -0,0 +1,382 @@
+# Headless batch runner for the pixel-art pipeline.
+# Only imports the Qt-free core, so it works without a display server.
+#
+# Example:
+#   python pixelart_batch.py test_images -o out --pixel-size 64 --colors 16 --bits RGB565 --workers 4
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+from pixelart_core import (
+    BIT_DEPTH_PRESETS,
+    BIT_ROUNDING_MODES,
+    DITHER_MODES,
+    GRID_ASPECTS,
+    PIXELATE_KERNELS,
+    QUANTIZERS,
+    apply_pixel_art_pipeline,
+    lazy_import,
+)
+from pixelart_animation import ANIMATION_PALETTES, convert_animation, is_animated
+from pixelart_export import (
+    DEFAULT_EXPORT_MEMORY_BUDGET,
+    EXPORT_PRESETS,
+    encode_image,
+    export_pixel_art_from_file,
+    export_pixel_art_tiled,
+)
+from pixelart_video import (
+    DEFAULT_SCENE_THRESHOLD,
+    SequenceError,
+    natural_sort_key,
+    stream_sequence,
+)
+
+Image = lazy_import("PIL.Image")
+
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".webp")
+
+# Output formats for --format; all of them keep the image indexed
+OUTPUT_FORMATS = ("png", "webp", "gif")
+
+# Fixed palette shared by every file a worker process handles
+_worker_palette = None
+
+
+def parse_bits(value):
+    #Accepts "5", "5,6,5" or a preset name such as "RGB565"
+    if value.upper() in BIT_DEPTH_PRESETS:
+        return value.upper()
+    parts = value.split(",")
+    try:
+        if len(parts) == 1:
+            return int(parts[0])
+        if len(parts) == 3:
+            return tuple(int(part) for part in parts)
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError(
+        f"bit depth must be N, R,G,B or one of {', '.join(BIT_DEPTH_PRESETS)}"
+    )
+
+
+def collect_inputs(patterns):
+    #Expands directories and glob patterns into a sorted list of image files
+    files = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            candidates = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+        else:
+            candidates = glob.glob(pattern, recursive=True)
+        for path in candidates:
+            if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS):
+                files.add(os.path.abspath(path))
+    return sorted(files)
+
+
+def load_fixed_palette(name_or_path):
+    #Builds a FixedPalette from a built-in name (pico-8, game-boy, nes) or a file
+    from pixelart_palette import BUILTIN_PALETTES, FixedPalette
+
+    if name_or_path.lower() in BUILTIN_PALETTES:
+        return FixedPalette.from_name(name_or_path)
+    return FixedPalette.from_file(name_or_path)
+
+
+def _init_worker(fixed_palette):
+    # Runs once per worker process; the lookup cube arrives prebuilt
+    global _worker_palette
+    _worker_palette = fixed_palette
+
+
+def output_path_for(src_path, output_dir, suffix, output_format="png"):
+    stem = os.path.splitext(os.path.basename(src_path))[0]
+    return os.path.join(output_dir, f"{stem}{suffix}.{output_format}")
+
+
+def process_file(src_path, out_path, pixel_size, palette_colors, bit_depth,
+                 memory_budget=None, pipeline_options=None, preset="balanced"):
+    #Runs in a worker process; returns (src_path, out_path, seconds, report,
+    #error) where report is the export_report (encoded bytes and encode time).
+    #With a memory_budget the output is streamed to disk in strips; without
+    #on_grid the source is still decoded in full, outside the budget.
+    #pipeline_options are extra keyword arguments for the pipeline (on_grid,
+    #quantizer, ...). on_grid runs decode only as large as the grid needs
+    #(at full size with "full_decode") and stream PNG output. With "animate", animated inputs keep
+    #every frame and become animated GIFs or APNGs (see pixelart_animation);
+    #"animation_palette" picks its palette mode.
+    pipeline_options = dict(pipeline_options or {})
+    if _worker_palette is not None:
+        pipeline_options["fixed_palette"] = _worker_palette
+    animate = pipeline_options.pop("animate", False)
+    animation_palette = pipeline_options.pop("animation_palette", "global")
+    full_decode = pipeline_options.pop("full_decode", False)
+    start = time.perf_counter()
+    try:
+        if animate and is_animated(src_path):
+            pipeline_options.pop("on_grid", None)
+            # The pool already runs one file per CPU; one thread per file
+            # still overlaps decoding with conversion
+            report = convert_animation(
+                src_path, out_path, pixel_size, palette_colors, bit_depth,
+                palette=animation_palette, workers=1, preset=preset, **pipeline_options,
+            )
+        elif pipeline_options.pop("on_grid", False):
+            report = export_pixel_art_from_file(
+                src_path, out_path, pixel_size, palette_colors, bit_depth,
+                memory_budget=memory_budget or DEFAULT_EXPORT_MEMORY_BUDGET,
+                preset=preset, full_decode=full_decode, **pipeline_options,
+            )
+        else:
+            with Image.open(src_path) as src:
+                image = src.convert("RGB")
+            if memory_budget is not None:
+                report = export_pixel_art_tiled(
+                    image, out_path, pixel_size, palette_colors, bit_depth,
+                    memory_budget=memory_budget, preset=preset, **pipeline_options,
+                )
+            else:
+                result = apply_pixel_art_pipeline(
+                    image, pixel_size, palette_colors, bit_depth, **pipeline_options
+                )
+                report = encode_image(result, out_path, preset)
+    except Exception as exc:
+        return src_path, out_path, time.perf_counter() - start, None, str(exc)
+    return src_path, out_path, time.perf_counter() - start, report, None
+
+
+def run_batch(files, output_dir, pixel_size, palette_colors, bit_depth,
+              workers=None, suffix="_pixel", memory_budget=None,
+              pipeline_options=None, fixed_palette=None, output_format="png",
+              preset="balanced", log=print):
+    #Fans files out over a process pool and returns (succeeded, failed, seconds,
+    #total encoded bytes).
+    #A fixed_palette has its lookup cube built here, once, and is handed to
+    #each worker at startup rather than with every file.
+    # Deferred: worker processes that import this module never need the pool
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    os.makedirs(output_dir, exist_ok=True)
+    succeeded = failed = total_bytes = 0
+    start = time.perf_counter()
+
+    if fixed_palette is not None:
+        fixed_palette.lookup_cube()
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(fixed_palette,)
+    ) as pool:
+        futures = [
+            pool.submit(
+                process_file,
+                path,
+                output_path_for(path, output_dir, suffix, output_format),
+                pixel_size,
+                palette_colors,
+                bit_depth,
+                memory_budget,
+                pipeline_options,
+                preset,
+            )
+            for path in files
+        ]
+        for future in as_completed(futures):
+            src_path, out_path, seconds, report, error = future.result()
+            if error is None:
+                succeeded += 1
+                total_bytes += report["bytes"]
+                log(
+                    f"{seconds * 1000:8.1f} ms  {report['bytes'] / 1024:9.1f} KiB  "
+                    f"encode {report['encode_seconds'] * 1000:7.1f} ms  "
+                    f"{src_path} -> {out_path}"
+                )
+            else:
+                failed += 1
+                log(f"  FAILED     {src_path}: {error}")
+
+    return succeeded, failed, time.perf_counter() - start, total_bytes
+
+
+def run_sequence(files, output_dir, pixel_size, palette_colors, bit_depth,
+                 suffix="_pixel", pipeline_options=None, fixed_palette=None,
+                 output_format="png", preset="balanced", log=print):
+    #Converts files as the frames of one video, in natural order, in this
+    #process (see pixelart_video.stream_sequence). Returns the same
+    #(succeeded, failed, seconds, total encoded bytes) as run_batch. A failing
+    #frame stops the run; the frames saved before it count as succeeded and
+    #the rest as failed.
+    os.makedirs(output_dir, exist_ok=True)
+    files = sorted(files, key=natural_sort_key)
+    jobs = [(path, output_path_for(path, output_dir, suffix, output_format)) for path in files]
+
+    def log_frame(path, seconds, new_palette):
+        marker = "  new palette" if new_palette else ""
+        log(f"{seconds * 1000:8.1f} ms  {path}{marker}")
+
+    try:
+        report = stream_sequence(
+            jobs, pixel_size, palette_colors, bit_depth, fixed_palette=fixed_palette,
+            preset=preset, log=log_frame, **(pipeline_options or {}),
+        )
+    except SequenceError as exc:
+        report = exc.report
+        log(f"  FAILED     after {report['frames']} of {len(files)} frame(s): {exc}")
+        return report["frames"], len(files) - report["frames"], report["seconds"], report["bytes"]
+    log(
+        f"{report['palettes']} palette(s), {report['frames_per_second']:.1f} frames/sec, "
+        f"encode {report['encode_seconds']:.2f} s"
+    )
+    return report["frames"], 0, report["seconds"], report["bytes"]
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="Convert images to pixel art without the GUI.",
+    )
+    parser.add_argument("inputs", nargs="+", help="image files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", default="pixel_art_output")
+    parser.add_argument("--pixel-size", type=int, default=128,
+                        help="grid resolution, 8-256 in the GUI (default: 128)")
+    parser.add_argument("--colors", type=int, default=128,
+                        help="palette size, 2-256 (default: 128)")
+    parser.add_argument("--bits", type=parse_bits, default=8,
+                        help="bits per channel: N, R,G,B or a preset like RGB565 (default: 8)")
+    parser.add_argument("--bit-rounding", choices=BIT_ROUNDING_MODES, default="truncate",
+                        help="drop the low bits, or snap to the nearest kept level "
+                             "(default: truncate)")
+    parser.add_argument("--quantizer", choices=QUANTIZERS, default="adaptive",
+                        help="palette builder (default: adaptive)")
+    parser.add_argument("--palette", default=None, metavar="NAME_OR_FILE",
+                        help="map onto a fixed palette: pico-8, game-boy, nes, a "
+                             ".hex/.gpl/.pal/.txt file or a .json palette saved from "
+                             "the GUI (overrides --colors)")
+    parser.add_argument("--dither", choices=DITHER_MODES, default="none",
+                        help="how pixels are mapped onto the palette (default: none)")
+    parser.add_argument("--kernel", choices=PIXELATE_KERNELS, default="lanczos",
+                        help="how each grid cell is averaged (default: lanczos)")
+    parser.add_argument("--aspect", choices=GRID_ASPECTS, default="square",
+                        help="square grid, or keep the source aspect ratio with "
+                             "--pixel-size cells on the longer side (default: square)")
+    parser.add_argument("--on-grid", action="store_true",
+                        help="do color work on the pixel grid and upscale last")
+    parser.add_argument("--full-decode", action="store_true",
+                        help="with --on-grid, decode sources at full size; slower and "
+                             "larger in memory, but the colors match the pipeline run on "
+                             "the full image exactly")
+    parser.add_argument("--animate", action="store_true",
+                        help="keep every frame of animated inputs and write animated "
+                             "GIF (--format gif) or APNG (--format png)")
+    parser.add_argument("--animation-palette", choices=ANIMATION_PALETTES, default="global",
+                        help="one palette for all frames, or a new one every 16 frames "
+                             "(GIF only; default: global)")
+    parser.add_argument("--sequence", action="store_true",
+                        help="treat the inputs as the frames of one video: convert them "
+                             "in order and reuse the palette until the scene changes")
+    parser.add_argument("--scene-threshold", type=float, default=DEFAULT_SCENE_THRESHOLD,
+                        help="with --sequence, how far (0-1) a frame's colors may drift "
+                             f"before a new palette is built (default: {DEFAULT_SCENE_THRESHOLD})")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes, not with --sequence (default: one per CPU)")
+    parser.add_argument("--memory-budget", type=int, default=None, metavar="MIB",
+                        help="stream each output in strips using at most this many MiB; "
+                             "without --on-grid the fully decoded source comes on top")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="png",
+                        help="indexed PNG, lossless WebP or GIF output (default: png)")
+    parser.add_argument("--preset", choices=EXPORT_PRESETS, default="balanced",
+                        help="encoder speed / file size trade-off (default: balanced)")
+    parser.add_argument("--suffix", default="_pixel",
+                        help="appended to each output file name (default: _pixel)")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+
+    files = collect_inputs(args.inputs)
+    if not files:
+        print("No input images found.", file=sys.stderr)
+        return 1
+
+    if args.memory_budget and args.format != "png" and not args.on_grid:
+        print("--memory-budget streams PNG only; use --format png or --on-grid.",
+              file=sys.stderr)
+        return 1
+
+    if args.animate and args.format == "webp":
+        print("--animate writes GIF or APNG; use --format gif or --format png.",
+              file=sys.stderr)
+        return 1
+    if (args.animate and args.format == "png" and args.animation_palette == "window"
+            and not args.palette):
+        print("APNG frames share one palette; use --animation-palette global.",
+              file=sys.stderr)
+        return 1
+
+    if args.sequence and (args.animate or args.memory_budget or args.workers is not None):
+        print("--sequence converts frames in order in this process; it cannot be "
+              "combined with --animate, --memory-budget or --workers.",
+              file=sys.stderr)
+        return 1
+
+    fixed_palette = load_fixed_palette(args.palette) if args.palette else None
+
+    if args.sequence:
+        succeeded, failed, seconds, total_bytes = run_sequence(
+            files,
+            args.output_dir,
+            args.pixel_size,
+            args.colors,
+            args.bits,
+            suffix=args.suffix,
+            pipeline_options={
+                "scene_threshold": args.scene_threshold,
+                "quantizer": args.quantizer,
+                "dither": args.dither,
+                "kernel": args.kernel,
+                "aspect": args.aspect,
+                "bit_rounding": args.bit_rounding,
+            },
+            fixed_palette=fixed_palette,
+            output_format=args.format,
+            preset=args.preset,
+        )
+    else:
+        succeeded, failed, seconds, total_bytes = run_batch(
+            files,
+            args.output_dir,
+            args.pixel_size,
+            args.colors,
+            args.bits,
+            workers=args.workers,
+            suffix=args.suffix,
+            memory_budget=args.memory_budget * 1024 * 1024 if args.memory_budget else None,
+            pipeline_options={
+                "on_grid": args.on_grid,
+                "full_decode": args.full_decode,
+                "quantizer": args.quantizer,
+                "dither": args.dither,
+                "kernel": args.kernel,
+                "aspect": args.aspect,
+                "bit_rounding": args.bit_rounding,
+                "animate": args.animate,
+                "animation_palette": args.animation_palette,
+            },
+            fixed_palette=fixed_palette,
+            output_format=args.format,
+            preset=args.preset,
+        )
+
+    rate = succeeded / seconds if seconds > 0 else 0.0
+    print(
+        f"{succeeded} image(s) in {seconds:.2f} s ({rate:.2f} images/sec), "
+        f"{total_bytes / 1024:.1f} KiB written, {failed} failed"
+    )
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
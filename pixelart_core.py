@@ -0,0 +1,661 @@
+# Qt-free image processing core for the pixel-art pipeline.
+# The GUI and the batch CLI both import from here, so nothing in this module may
+# depend on PySide6. Heavy dependencies (Pillow, numpy) are loaded on first use,
+# which keeps CLI and worker-process startup to a few milliseconds;
+# bench_pixelart.py measures it.
+
+import importlib
+import math
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+
+
+class _LazyModule:
+    #Stands in for a module and imports it on first attribute access
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+def lazy_import(name):
+    #Returns a proxy for module name that is only imported when first used
+    return _LazyModule(name)
+
+
+Image = lazy_import("PIL.Image")
+
+
+# Image processing helpers
+
+# Kernels pixelate_grid can downsample with. "box" (exact block means) and
+# "median" go through a pixelart_grid.GridSampler and need numpy.
+PIXELATE_KERNELS = ("lanczos", "box", "median")
+
+# "square" makes a target_size x target_size grid whatever the source shape;
+# "preserve" gives the longer side target_size cells and keeps the aspect ratio
+GRID_ASPECTS = ("square", "preserve")
+
+
+def grid_size(image_size, target_size, aspect="square"):
+    #(columns, rows) of the pixel grid for an image of image_size
+    if aspect not in GRID_ASPECTS:
+        raise ValueError(f"Unknown grid aspect: {aspect!r}")
+    width, height = image_size
+
+    if aspect == "square":
+        # Clamp target_size so we don't go larger than the image itself
+        side = max(1, min(target_size, width, height))
+        return side, side
+
+    long_side = max(width, height)
+    scale = max(1, min(target_size, long_side)) / long_side
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def pixelate_grid(image, target_size, kernel="lanczos", aspect="square", sampler=None):
+    #Downsamples an image to its pixel grid (see grid_size) with kernel.
+    #sampler is a GridSampler of this image to reuse across grid sizes; box and
+    #median build a throwaway one when it is missing.
+    if kernel not in PIXELATE_KERNELS:
+        raise ValueError(f"Unknown pixelation kernel: {kernel!r}")
+    size = grid_size(image.size, target_size, aspect)
+
+    if sampler is None:
+        if kernel == "lanczos":
+            return image.resize(size, resample=Image.Resampling.LANCZOS)
+        # numpy is only needed for the sampler kernels
+        from pixelart_grid import GridSampler
+
+        sampler = GridSampler(image)
+    return sampler.grid(size, kernel)
+
+
+def upscale_grid(grid, size):
+    #Blows a grid back up to size with NEAREST, one flat block per cell.
+    return grid.resize(size, resample=Image.Resampling.NEAREST)
+
+
+def pixelate(image, target_size, kernel="lanczos", aspect="square", sampler=None):
+    #Creates a pixelated image: pixelate_grid, then a NEAREST upscale.
+    return upscale_grid(
+        pixelate_grid(image, target_size, kernel, aspect, sampler), image.size
+    )
+
+
+def load_preview_source(file_name, long_side, min_side=1):
+    #Opens an image decoded only as large as a preview needs. JPEGs are scaled
+    #by 1/2, 1/4 or 1/8 during decoding (Image.draft) to the smallest size that
+    #still covers long_side and min_side, skipping most of the decode work and
+    #memory; other formats decode in full. Returns (RGB image, full size).
+    with Image.open(file_name) as src:
+        width, height = src.size
+        scale = max(long_side / max(width, height), min_side / min(width, height))
+        if scale < 1.0:
+            src.draft("RGB", (math.ceil(width * scale), math.ceil(height * scale)))
+        return src.convert("RGB"), (width, height)
+
+
+# Longer-side sizes of the preview pyramid levels
+PREVIEW_PYRAMID_SIZES = (256, 512, 1024, 2048)
+
+
+def build_preview_pyramid(image, sizes=PREVIEW_PYRAMID_SIZES):
+    #Downscaled copies of image for previews, smallest first, one per size that
+    #is smaller than the image's longer side. Each level is resampled from the
+    #next larger one, so the whole pyramid costs about as much as its top level.
+    #If image fits within the largest size it becomes the top level itself.
+    width, height = image.size
+    long_side = max(width, height)
+
+    levels = [] if long_side > max(sizes) else [image]
+    current = image
+    for size in sorted(sizes, reverse=True):
+        if size >= long_side:
+            continue
+        scale = size / long_side
+        level_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        # reducing_gap box-reduces steps of 3x or more (very large sources)
+        # before the LANCZOS pass, which looks the same and is much cheaper
+        current = current.resize(
+            level_size, resample=Image.Resampling.LANCZOS, reducing_gap=3.0
+        )
+        levels.append(current)
+    levels.reverse()
+    return levels
+
+
+def pick_pyramid_level(pyramid, long_side, min_side=1):
+    #Smallest level whose longer side covers long_side and whose shorter side
+    #covers min_side (e.g. the pixel size, so the grid is not clamped); the
+    #largest level when none does
+    for level in pyramid:
+        if max(level.size) >= long_side and min(level.size) >= min_side:
+            return level
+    return pyramid[-1]
+
+
+QUANTIZERS = ("adaptive", "tree", "kmeans")
+
+# "none" keeps each color in its palette box. Pillow ignores the dither
+# argument for ADAPTIVE quantization, so this is what the pipeline always
+# produced. The ordered modes threshold every pixel independently.
+DITHER_MODES = ("none", "floyd-steinberg", "bayer2", "bayer4", "bayer8", "blue-noise")
+
+# Modes that leave a pixel alone when its exact color is in the palette
+EXACT_DITHER_MODES = ("none", "floyd-steinberg")
+
+
+def drop_transparency(image):
+    #Removes the transparency Pillow's quantize() copies over from its source.
+    #An RGB PNG with a tRNS chunk carries it as an (r, g, b) tuple, which is
+    #not valid on a P image and makes save() fail. Pipeline output is always
+    #opaque, so it is dropped whatever its type. Returns image.
+    image.info.pop("transparency", None)
+    return image
+
+
+def color_pal_reduce(image, target_colors, tree=None, dither="none",
+                     fixed_palette=None, histogram=None):
+    #Reduces the color palette of an image to a specified number of colors.
+    #With a PaletteTree (or PaletteRefiner) built from this image the palette
+    #comes from it instead of running a fresh quantization. Any dither other than "none"
+    #builds the palette first and then remaps the image onto it.
+    #A FixedPalette replaces the adaptive palette entirely (target_colors and
+    #tree are ignored) and maps pixels through its lookup cube.
+    #Returns a P-mode image: one byte per pixel plus a palette table, which the
+    #rest of the pipeline keeps (see color_bit_reduce).
+    #Images that already fit in target_colors skip quantization: a P image is
+    #returned as is, and with the image's ColorHistogram (pixelart_palette) an
+    #RGB one is mapped exactly. Ordered dithering still runs, since its
+    #pattern shifts even exact colors.
+    if dither not in DITHER_MODES:
+        raise ValueError(f"Unknown dither mode: {dither!r}")
+    target_colors = max(2, min(target_colors, 256))
+
+    if fixed_palette is not None:
+        return fixed_palette.quantize(image, dither)
+
+    if dither in EXACT_DITHER_MODES:
+        if image.mode == "P" and image.getcolors(target_colors) is not None:
+            return image
+        if histogram is not None and histogram.color_count <= target_colors:
+            return histogram.exact_image()
+
+    if tree is not None:
+        quantized_img = tree.quantize(target_colors)
+    else:
+        quantized_img = drop_transparency(image.quantize(
+            colors=target_colors,
+            method=Image.ADAPTIVE,
+            dither=Image.Dither.FLOYDSTEINBERG,
+        ))
+
+    if dither != "none":
+        # numpy is only needed for the dithering engine
+        from pixelart_palette import dither_to_palette
+
+        quantized_img = dither_to_palette(image, quantized_img, dither)
+
+    return quantized_img
+
+
+# Named per-channel bit layouts as (red, green, blue) bit counts
+BIT_DEPTH_PRESETS = {
+    "RGB888": (8, 8, 8),
+    "RGB565": (5, 6, 5),
+    "RGB555": (5, 5, 5),
+    "RGB444": (4, 4, 4),
+    "RGB332": (3, 3, 2),
+}
+
+BIT_ROUNDING_MODES = ("truncate", "round")
+
+
+def channel_bits(target_bits):
+    #Normalizes an int, (r, g, b) tuple or preset name into three clamped bit counts.
+    if isinstance(target_bits, str):
+        target_bits = BIT_DEPTH_PRESETS[target_bits.upper()]
+    if isinstance(target_bits, int):
+        target_bits = (target_bits,) * 3
+    return tuple(max(1, min(int(bits), 8)) for bits in target_bits)
+
+
+@lru_cache(maxsize=None)
+def bit_depth_lut(target_bits, rounding="truncate"):
+    #Builds the 256-entry table mapping a channel value to its reduced value.
+    if rounding not in BIT_ROUNDING_MODES:
+        raise ValueError(f"Unknown rounding mode: {rounding!r}")
+
+    bitmask = (0xFF << (8 - target_bits)) & 0xFF
+    if rounding == "truncate":
+        # Same result as masking each pixel with the top target_bits bits
+        return tuple(value & bitmask for value in range(256))
+
+    # Snap to the nearest kept level instead of always rounding down
+    half_step = (1 << (8 - target_bits)) >> 1
+    return tuple(min(value + half_step, 255) & bitmask for value in range(256))
+
+
+def color_bit_reduce(image, target_bits, rounding="truncate"):
+    #Reduces color depth of an image to a specified number of bits per channel.
+    #target_bits can be one int for all channels, an (r, g, b) tuple or a preset
+    #name like "RGB565". The whole image goes through a single lookup table.
+    #P-mode images keep their pixel indices and only have the lookup applied to
+    #their palette, at most 256 entries however large the image is.
+    bits = channel_bits(target_bits)
+
+    lut = []
+    for channel_depth in bits:
+        lut.extend(bit_depth_lut(channel_depth, rounding))
+
+    if image.mode == "P":
+        palette = image.getpalette()
+        # Copy so cached stage results keep their original palette
+        image = image.copy()
+        image.putpalette([
+            lut[(offset % 3) * 256 + value] for offset, value in enumerate(palette)
+        ])
+        return image
+
+    image = image.convert("RGB")
+    return image.point(lut)
+
+
+class StageCache:
+    #LRU cache of intermediate pipeline images, keyed by the source image and
+    #every parameter upstream of the stage. Entries are evicted oldest-first once
+    #their combined pixel data exceeds max_bytes. hits/misses can be read to tune
+    #the ceiling.
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def image_bytes(image):
+        # Non-image stage results (e.g. a PaletteTree) report their own size
+        if hasattr(image, "nbytes"):
+            return image.nbytes
+        width, height = image.size
+        return width * height * len(image.getbands())
+
+    def get(self, src_image, stage, params):
+        key = (id(src_image), stage, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            # id() can be reused after the source is freed, so check identity too
+            if entry is None or entry[0] is not src_image:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, src_image, stage, params, image):
+        key = (id(src_image), stage, params)
+        size = self.image_bytes(image)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old[2]
+            self._entries[key] = (src_image, image, size)
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+def _cached_stage(cache, src_image, stage, params, compute):
+    if cache is None:
+        return compute()
+    image = cache.get(src_image, stage, params)
+    if image is None:
+        image = compute()
+        cache.put(src_image, stage, params, image)
+    return image
+
+
+# Stage timing instrumentation
+
+# Set to "1" / "stderr" to log stage timings to stderr, or to a file path to
+# append them there, one JSON object per line
+TIMING_LOG_ENV = "PIXELART_TIMING_LOG"
+
+_timing_hooks = []
+_timing_log_lock = threading.Lock()
+
+
+def add_timing_hook(callback):
+    #Subscribe to stage timings. callback(record) gets a dict with "event",
+    #"timestamp", "stages" (name -> seconds, in run order), "total" and any
+    #context the run was started with. Returns callback, so it works as a decorator.
+    _timing_hooks.append(callback)
+    return callback
+
+
+def remove_timing_hook(callback):
+    if callback in _timing_hooks:
+        _timing_hooks.remove(callback)
+
+
+class StageTimer:
+    #Collects per-stage durations for one run. Stages can be added by several
+    #layers (pipeline, preview display, ...); publish() then hands the record to
+    #the timing hooks and the JSON-lines log.
+
+    def __init__(self, event, **context):
+        self.event = event
+        self.context = context
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    @property
+    def total(self):
+        return sum(self.stages.values())
+
+    def as_record(self):
+        record = {
+            "event": self.event,
+            "timestamp": time.time(),
+            "stages": dict(self.stages),
+            "total": self.total,
+        }
+        record.update(self.context)
+        return record
+
+    def publish(self):
+        record = self.as_record()
+        for hook in list(_timing_hooks):
+            hook(record)
+        _log_timing_record(record)
+        return record
+
+
+def _log_timing_record(record):
+    target = os.environ.get(TIMING_LOG_ENV)
+    if not target:
+        return
+    # json pulls in re; only pay for it when timings are actually logged
+    import json
+
+    line = json.dumps(record, default=str)
+    with _timing_log_lock:
+        if target in ("1", "stderr"):
+            print(line, file=sys.stderr, flush=True)
+        else:
+            with open(target, "a", encoding="utf-8") as log_file:
+                log_file.write(line + "\n")
+
+
+class RenderCancelled(Exception):
+    #Raised between pipeline stages when the caller no longer wants the result
+    pass
+
+
+def _check_cancelled(should_cancel):
+    if should_cancel is not None and should_cancel():
+        raise RenderCancelled()
+
+
+def apply_pixel_art_pipeline(src_image, pixel_size, palette_colors, bit_depth,
+                             should_cancel=None, cache=None, on_grid=False,
+                             upscale=True, quantizer="adaptive", dither="none",
+                             fixed_palette=None, timer=None, kernel="lanczos",
+                             aspect="square", bit_rounding="truncate"):
+    #Run the full pixel-art pipeline on a given Pillow image.
+    #should_cancel is polled between stages; if it returns True the run stops
+    #with RenderCancelled so superseded previews don't finish for nothing.
+    #With a StageCache, each stage is reused when its upstream parameters match,
+    #so moving only the bit-depth slider skips pixelate and quantize.
+    #
+    #on_grid=True runs the palette and bit-depth stages on the small grid and
+    #does the NEAREST upscale last (or not at all with upscale=False, leaving it
+    #to the display or exporter). That is about block_size**2 times less work.
+    #The output differs from the default mode in two ways. Floyd-Steinberg
+    #error spreads between neighboring cells instead of between pixels of the
+    #upscaled image, so every block is one flat palette color rather than a
+    #dithered patch. And the tree and kmeans quantizers weigh colors by pixel
+    #count: on the grid every cell counts once, while upscaled blocks differ
+    #by a row or column when the pixel size does not divide the image, so
+    #their palettes can differ slightly. Both modes give the same colors when
+    #it does divide evenly, or with the adaptive quantizer.
+    #
+    #quantizer="tree" builds a PaletteTree once per pixelated image (cached as
+    #its own stage) and cuts every palette size from it, so scrubbing the
+    #palette slider only costs a lookup per pixel. quantizer="kmeans" caches a
+    #PaletteRefiner the same way: each palette size is refined with k-means,
+    #warm-started from the last size solved, so consecutive slider ticks change
+    #as few colors as possible.
+    #
+    #On the grid, and whenever the tree or kmeans quantizer runs, a
+    #ColorHistogram of the pixelated image is cached as well. It seeds the tree, and when the image
+    #has no more colors than palette_colors it replaces quantization with an
+    #exact mapping (see color_pal_reduce); the tree is then not built at all.
+    #
+    #kernel (PIXELATE_KERNELS) and aspect (GRID_ASPECTS) shape the grid; see
+    #pixelate_grid. With a cache, box and median keep the source's GridSampler
+    #as a stage of its own, so every later pixel size is computed from its
+    #summed-area table instead of the source pixels.
+    #
+    #dither picks one of DITHER_MODES for mapping pixels onto the palette and
+    #bit_rounding one of BIT_ROUNDING_MODES for the bit-depth stage.
+    #fixed_palette (a pixelart_palette.FixedPalette) maps onto that palette
+    #instead of building one; palette_colors and quantizer are then ignored.
+    #
+    #The result is an indexed (P-mode) image at a third of the memory of RGB;
+    #the bit-depth stage only rewrites its palette table, so bit-depth changes
+    #cost next to nothing. Convert it before saving to formats without palettes.
+    #
+    #Per-stage durations go to timer (a StageTimer) when one is passed; the
+    #caller publishes it. Otherwise the pipeline times itself and publishes a
+    #"pipeline" record to the timing hooks when it finishes.
+    if quantizer not in QUANTIZERS:
+        raise ValueError(f"Unknown quantizer: {quantizer!r}")
+    if dither not in DITHER_MODES:
+        raise ValueError(f"Unknown dither mode: {dither!r}")
+
+    if kernel not in PIXELATE_KERNELS:
+        raise ValueError(f"Unknown pixelation kernel: {kernel!r}")
+    if bit_rounding not in BIT_ROUNDING_MODES:
+        raise ValueError(f"Unknown rounding mode: {bit_rounding!r}")
+
+    grid_key = (pixel_size, kernel, aspect)
+    if fixed_palette is not None:
+        palette_key = grid_key + (fixed_palette, dither)
+    else:
+        palette_key = grid_key + (palette_colors, quantizer, dither)
+    bits_key = palette_key + (bit_depth, bit_rounding)
+
+    if on_grid:
+        pixel_stage, palette_stage, bits_stage = "grid", "grid_palette", "grid_bits"
+    else:
+        pixel_stage, palette_stage, bits_stage = "pixelate", "palette", "bits"
+
+    def pixelate_stage():
+        sampler = None
+        if kernel != "lanczos" and cache is not None:
+            # numpy is only needed for the sampler kernels
+            from pixelart_grid import GridSampler
+
+            sampler = _cached_stage(
+                cache, src_image, "sampler", (), lambda: GridSampler(src_image)
+            )
+        if on_grid:
+            return pixelate_grid(src_image, pixel_size, kernel, aspect, sampler)
+        return pixelate(src_image, pixel_size, kernel, aspect, sampler)
+
+    owns_timer = timer is None
+    if owns_timer:
+        timer = StageTimer(
+            "pipeline", size=src_image.size, pixel_size=pixel_size,
+            palette_colors=palette_colors, bit_depth=bit_depth, on_grid=on_grid,
+        )
+
+    with timer.stage("resample"):
+        img = _cached_stage(cache, src_image, pixel_stage, grid_key, pixelate_stage)
+    _check_cancelled(should_cancel)
+
+    histogram = tree = None
+    if fixed_palette is None and (on_grid or quantizer != "adaptive"):
+        # numpy is only needed for the histogram and the tree quantizers; full
+        # size images skip the histogram unless a tree needs it anyway
+        from pixelart_palette import ColorHistogram, PaletteRefiner, PaletteTree
+
+        with timer.stage("histogram"):
+            histogram = _cached_stage(
+                cache, src_image, palette_stage + "_histogram", grid_key,
+                lambda: ColorHistogram(img),
+            )
+        _check_cancelled(should_cancel)
+
+        needs_tree = (
+            dither not in EXACT_DITHER_MODES
+            or histogram.color_count > max(2, min(palette_colors, 256))
+        )
+        if quantizer == "tree" and needs_tree:
+            with timer.stage("palette_tree"):
+                tree = _cached_stage(
+                    cache, src_image, palette_stage + "_tree", grid_key,
+                    lambda: PaletteTree(img, histogram=histogram),
+                )
+            _check_cancelled(should_cancel)
+        elif quantizer == "kmeans" and needs_tree:
+            with timer.stage("palette_refiner"):
+                tree = _cached_stage(
+                    cache, src_image, palette_stage + "_refiner", grid_key,
+                    lambda: PaletteRefiner(img, histogram=histogram),
+                )
+            _check_cancelled(should_cancel)
+
+    with timer.stage("quantize"):
+        img = _cached_stage(
+            cache, src_image, palette_stage, palette_key,
+            lambda: color_pal_reduce(
+                img, palette_colors, tree=tree, dither=dither,
+                fixed_palette=fixed_palette, histogram=histogram,
+            ),
+        )
+    _check_cancelled(should_cancel)
+    with timer.stage("bit_reduce"):
+        img = _cached_stage(
+            cache, src_image, bits_stage, bits_key,
+            lambda: color_bit_reduce(img, bit_depth, bit_rounding),
+        )
+
+    if on_grid and upscale:
+        _check_cancelled(should_cancel)
+        with timer.stage("upscale"):
+            img = upscale_grid(img, src_image.size)
+
+    if owns_timer:
+        timer.publish()
+    return img
+
+
+def cached_grid(cache, src_image, pixel_size, kernel="lanczos", aspect="square"):
+    #The pixel grid an on_grid=True pipeline run left in cache for src_image,
+    #or None. Lets a caller inspect the grid (or run the pipeline again with
+    #other palette settings) without resampling the source a second time.
+    return cache.get(src_image, "grid", (pixel_size, kernel, aspect))
+
+
+def palette_artifact(result, name=None, **settings):
+    #Captures the palette of a pipeline result (a P-mode image) as a
+    #pixelart_palette.FixedPalette that remembers the settings it came from.
+    #Passing it back as fixed_palette turns the quantize stage into a remap
+    #onto exactly these colors, so an export or a batch of other files gets
+    #the palette that was approved on the preview instead of a fresh one.
+    #Its colors already went through the bit-depth stage; running that stage
+    #again with the same depth and rounding leaves them unchanged. save() writes it to disk.
+    # numpy is only needed for the palette lookup
+    from pixelart_palette import FixedPalette
+
+    settings.pop("fixed_palette", None)
+    return FixedPalette.from_image(result, name=name, settings=settings)
+
+
+# Largest grid the draft pass renders; bigger pixel sizes are shown coarser
+# until the full pass lands
+DRAFT_GRID_SIZE = 64
+
+
+def apply_pixel_art_draft(src_image, pixel_size, palette_colors, bit_depth,
+                          quantizer="adaptive", dither="none", fixed_palette=None,
+                          timer=None, kernel="lanczos", aspect="square",
+                          bit_rounding="truncate"):
+    #Cheap first pass for progressive previews, a few milliseconds on a 512 px
+    #preview. Takes the same arguments as apply_pixel_art_pipeline but renders a
+    #grid of at most DRAFT_GRID_SIZE cells with a BOX filter, picks the palette
+    #with Pillow's fast octree, and skips dithering (quantizer, dither and
+    #kernel are ignored). A fixed_palette is still used, mapped to the nearest
+    #colors, and aspect and bit_rounding still apply.
+    #Returns the small grid, like on_grid=True, upscale=False.
+    owns_timer = timer is None
+    if owns_timer:
+        timer = StageTimer(
+            "draft", size=src_image.size, pixel_size=pixel_size,
+            palette_colors=palette_colors, bit_depth=bit_depth,
+        )
+    draft_size = grid_size(src_image.size, min(pixel_size, DRAFT_GRID_SIZE), aspect)
+
+    with timer.stage("draft_resample"):
+        grid = src_image.resize(draft_size, resample=Image.Resampling.BOX)
+
+    with timer.stage("draft_quantize"):
+        if fixed_palette is not None:
+            grid = fixed_palette.quantize(grid, "none")
+        else:
+            grid = drop_transparency(grid.quantize(
+                colors=max(2, min(palette_colors, 256)),
+                method=Image.Quantize.FASTOCTREE,
+                dither=Image.Dither.NONE,
+            ))
+
+    with timer.stage("draft_bit_reduce"):
+        grid = color_bit_reduce(grid, bit_depth, bit_rounding)
+
+    if owns_timer:
+        timer.publish()
+    return grid
@@ -0,0 +1,390 @@
+# Export helpers that keep memory bounded for very large outputs.
+# Like pixelart_core, this module must not import Qt.
+
+import os
+import struct
+import time
+import zlib
+
+from pixelart_core import (
+    QUANTIZERS,
+    apply_pixel_art_pipeline,
+    color_bit_reduce,
+    lazy_import,
+    load_preview_source,
+    pixelate_grid,
+    upscale_grid,
+)
+
+Image = lazy_import("PIL.Image")
+
+
+# Roughly how many bytes one output pixel costs while its strip is in flight:
+# the NEAREST-upscaled RGB strip, the quantized P strip, the bit-reduced RGB
+# strip, its raw bytes and the filtered PNG rows.
+STRIP_BYTES_PER_PIXEL = 16
+
+DEFAULT_EXPORT_MEMORY_BUDGET = 64 * 1024 * 1024
+
+# export_pixel_art_from_file decodes the source with at least this many source
+# pixels per grid cell along its short side. The grid then looks like one
+# resampled from the full decode, but its colors are not the same (see there).
+GRID_DECODE_OVERSAMPLE = 4
+
+# Output formats Pillow can write indexed images to; anything else (JPEG) gets
+# an RGB conversion first
+PALETTE_FORMATS = (".png", ".gif", ".bmp", ".tif", ".tiff", ".webp")
+
+EXPORT_PRESETS = ("fast", "balanced", "smallest")
+
+# Pillow save() options per output extension and preset. PNG levels also drive
+# the streaming writer. WebP is always lossless (libwebp switches to its own
+# palette mode for <= 256 colors); its method trades encode time for size.
+ENCODER_OPTIONS = {
+    ".png": {
+        "fast": {"compress_level": 1},
+        "balanced": {"compress_level": 6},
+        "smallest": {"compress_level": 9, "optimize": True},
+    },
+    ".webp": {
+        "fast": {"lossless": True, "method": 0, "quality": 0},
+        "balanced": {"lossless": True, "method": 4, "quality": 80},
+        # quality 100 is libwebp's exhaustive search: ~30x slower for ~2%
+        "smallest": {"lossless": True, "method": 6, "quality": 95},
+    },
+    ".gif": {
+        "fast": {"optimize": False},
+        "balanced": {"optimize": True},
+        "smallest": {"optimize": True},
+    },
+}
+
+
+class StreamingPNGWriter:
+    #Writes an RGB, grayscale or indexed PNG a band of rows at a time, so the
+    #full image never has to exist in memory. Use as a context manager.
+    #Indexed PNGs can be packed to 1, 2 or 4 bits per pixel (bit_depth) when the
+    #palette is small enough; see palette_bit_depth.
+
+    _COLOR_TYPES = {"L": (0, 1), "RGB": (2, 3), "P": (3, 1)}
+
+    def __init__(self, file_name, width, height, mode="RGB", palette=None,
+                 compress_level=6, bit_depth=8):
+        if mode not in self._COLOR_TYPES:
+            raise ValueError(f"Unsupported PNG mode: {mode!r}")
+        if bit_depth != 8 and (mode != "P" or bit_depth not in (1, 2, 4)):
+            raise ValueError(f"Unsupported bit depth {bit_depth} for mode {mode!r}")
+
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.rows_written = 0
+
+        color_type, bytes_per_pixel = self._COLOR_TYPES[mode]
+        self._stride = (width * bytes_per_pixel * bit_depth + 7) // 8
+        self._rawmode = f"P;{bit_depth}" if bit_depth < 8 else mode
+        self._compressor = zlib.compressobj(compress_level)
+        self._file = open(file_name, "wb")
+
+        self._file.write(b"\x89PNG\r\n\x1a\n")
+        self._write_chunk(
+            b"IHDR",
+            struct.pack(">IIBBBBB", width, height, bit_depth, color_type, 0, 0, 0),
+        )
+        if mode == "P":
+            if palette is None:
+                raise ValueError("Indexed PNG output needs a palette")
+            self._write_chunk(b"PLTE", bytes(palette))
+
+    def _write_chunk(self, chunk_type, data):
+        self._file.write(struct.pack(">I", len(data)))
+        self._file.write(chunk_type)
+        self._file.write(data)
+        self._file.write(struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF))
+
+    def write_rows(self, image):
+        #Appends the rows of a full-width Pillow image in this writer's mode
+        if image.mode != self.mode or image.size[0] != self.width:
+            raise ValueError("Strip does not match the PNG width or mode")
+        if self.rows_written + image.size[1] > self.height:
+            raise ValueError("Too many rows for this PNG")
+
+        stride = self._stride
+        raw = image.tobytes("raw", self._rawmode)
+        # Filter type 0 (None) in front of every row
+        filtered = b"".join(
+            b"\x00" + raw[offset:offset + stride]
+            for offset in range(0, len(raw), stride)
+        )
+        compressed = self._compressor.compress(filtered)
+        if compressed:
+            self._write_chunk(b"IDAT", compressed)
+        self.rows_written += image.size[1]
+
+    def close(self):
+        if self._file.closed:
+            return
+        try:
+            if self.rows_written != self.height:
+                raise ValueError(
+                    f"PNG expects {self.height} rows, got {self.rows_written}"
+                )
+            self._write_chunk(b"IDAT", self._compressor.flush())
+            self._write_chunk(b"IEND", b"")
+        finally:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+
+
+def encoder_options(file_name, preset="balanced"):
+    #Pillow save() keyword arguments for file_name's format under preset
+    if preset not in EXPORT_PRESETS:
+        raise ValueError(f"Unknown export preset: {preset!r}")
+    extension = os.path.splitext(file_name)[1].lower()
+    return dict(ENCODER_OPTIONS.get(extension, {}).get(preset, {}))
+
+
+def png_compress_level(preset="balanced"):
+    #zlib level of the streaming PNG writer under preset
+    return encoder_options("image.png", preset)["compress_level"]
+
+
+def export_report(file_name, preset, encode_seconds):
+    #What an export wrote: {"file_name", "format", "preset", "bytes",
+    #"encode_seconds"}
+    return {
+        "file_name": file_name,
+        "format": os.path.splitext(file_name)[1].lower().lstrip("."),
+        "preset": preset,
+        "bytes": os.path.getsize(file_name),
+        "encode_seconds": encode_seconds,
+    }
+
+
+def encode_image(image, file_name, preset="balanced"):
+    #Saves a finished pixel-art image with the preset's encoder options and
+    #returns its export_report. P-mode images stay indexed where the format
+    #allows it.
+    options = encoder_options(file_name, preset)
+    start = time.perf_counter()
+    if image.mode == "P" and not file_name.lower().endswith(PALETTE_FORMATS):
+        image = image.convert("RGB")
+    image.save(file_name, **options)
+    return export_report(file_name, preset, time.perf_counter() - start)
+
+
+def palette_bit_depth(color_count):
+    #Fewest PNG bits per pixel (1, 2, 4 or 8) that can index color_count colors
+    for bits in (1, 2, 4):
+        if color_count <= 1 << bits:
+            return bits
+    return 8
+
+
+def rows_per_strip(width, memory_budget, bytes_per_pixel=STRIP_BYTES_PER_PIXEL):
+    #How many full-width output rows fit in the memory budget at once
+    return max(1, memory_budget // max(1, width * bytes_per_pixel))
+
+
+def _nearest_source_rows(grid_height, height):
+    #Grid row that a NEAREST resize to height rows copies into each output
+    #row. Steps through row centers the way Pillow's scaling loop does, adding
+    #the scale once per row, so rows that land exactly between two grid rows
+    #round the same way.
+    scale = grid_height / height
+    position = scale * 0.5
+    rows = []
+    for _ in range(height):
+        rows.append(int(position))
+        position += scale
+    return rows
+
+
+def upscaled_strips(grid, width, height, strip_height):
+    #Yields (top, strip) bands of grid.resize((width, height), NEAREST) without
+    #ever building the full image. Bands are copied out of a full-width copy of
+    #the grid, so they match the one-shot resize bit for bit.
+    grid_height = grid.size[1]
+    wide = grid.resize((width, grid_height), resample=Image.Resampling.NEAREST)
+
+    source_rows = _nearest_source_rows(grid_height, height)
+
+    for top in range(0, height, strip_height):
+        bottom = min(height, top + strip_height)
+        strip = Image.new(grid.mode, (width, bottom - top))
+
+        y = top
+        while y < bottom:
+            row = source_rows[y]
+            run_end = y
+            while run_end < bottom and source_rows[run_end] == row:
+                run_end += 1
+            band = wide.crop((0, row, width, row + 1)).resize(
+                (width, run_end - y), resample=Image.Resampling.NEAREST
+            )
+            strip.paste(band, (0, y - top))
+            y = run_end
+
+        yield top, strip
+
+
+def strip_height_for(grid, width, memory_budget):
+    # The full-width copy of the grid stays resident next to the strips
+    wide_bytes = width * grid.size[1] * 3
+    return rows_per_strip(width, max(0, memory_budget - wide_bytes))
+
+
+def write_upscaled_png(grid, file_name, size, memory_budget=DEFAULT_EXPORT_MEMORY_BUDGET,
+                       compress_level=6):
+    #Streams grid NEAREST-upscaled to size into a PNG, strip by strip. P-mode
+    #grids are written as indexed PNGs with the palette trimmed to the indices
+    #in use and packed to as few bits per pixel as that allows.
+    width, height = size
+    strip_height = strip_height_for(grid, width, memory_budget)
+    palette, bit_depth = None, 8
+    if grid.mode == "P":
+        color_count = grid.getextrema()[1] + 1
+        palette = grid.getpalette()[:color_count * 3]
+        bit_depth = palette_bit_depth(color_count)
+    with StreamingPNGWriter(
+        file_name, width, height, mode=grid.mode, palette=palette,
+        compress_level=compress_level, bit_depth=bit_depth,
+    ) as writer:
+        for _, strip in upscaled_strips(grid, width, height, strip_height):
+            writer.write_rows(strip)
+    return file_name
+
+
+def export_pixel_art_tiled(src_image, file_name, pixel_size, palette_colors,
+                           bit_depth, memory_budget=DEFAULT_EXPORT_MEMORY_BUDGET,
+                           on_grid=False, quantizer="adaptive", dither="none",
+                           fixed_palette=None, preset="balanced", kernel="lanczos",
+                           aspect="square", bit_rounding="truncate"):
+    #Writes the pixel-art PNG for src_image in horizontal strips.
+    #The small grid and its palette are computed once; each strip is then
+    #upscaled, remapped to that palette, bit-reduced and streamed to disk, so the
+    #output side stays under memory_budget however tall or wide it is. The
+    #budget does not cover src_image itself, which the caller has already
+    #decoded in full; export_pixel_art_from_file avoids that decode.
+    #Differences from apply_pixel_art_pipeline: the palette is built from the
+    #grid cells rather than the upscaled copy, and strips are remapped onto it
+    #with dither ("none" snaps to the nearest palette color). The palette is
+    #the same unless the tree or kmeans quantizer runs on a grid that does not
+    #divide the image evenly, where every cell counts once rather than by its
+    #block's pixel count (see apply_pixel_art_pipeline's on_grid).
+    #Floyd-Steinberg error does not carry across strips; ordered patterns stay
+    #aligned to the full image.
+    #With on_grid=True all color work happens once on the grid (see
+    #apply_pixel_art_pipeline) and strips are only upscaled, giving exactly the
+    #output of apply_pixel_art_pipeline(..., on_grid=True) with the same
+    #quantizer, dither, fixed_palette, kernel, aspect and bit_rounding.
+    #preset picks the PNG compression level (EXPORT_PRESETS). Returns the
+    #export_report; its encode time covers upscaling and writing the strips.
+    width, height = src_image.size
+    compress_level = png_compress_level(preset)
+
+    if on_grid:
+        grid = apply_pixel_art_pipeline(
+            src_image, pixel_size, palette_colors, bit_depth,
+            on_grid=True, upscale=False, quantizer=quantizer, dither=dither,
+            fixed_palette=fixed_palette, kernel=kernel, aspect=aspect,
+            bit_rounding=bit_rounding,
+        )
+        start = time.perf_counter()
+        write_upscaled_png(
+            grid, file_name, (width, height), memory_budget, compress_level
+        )
+        return export_report(file_name, preset, time.perf_counter() - start)
+
+    if quantizer not in QUANTIZERS:
+        raise ValueError(f"Unknown quantizer: {quantizer!r}")
+
+    # numpy is only needed when strips are remapped here
+    from pixelart_palette import PaletteRefiner, PaletteTree, dither_to_palette
+
+    grid = pixelate_grid(src_image, pixel_size, kernel, aspect)
+    target_colors = max(2, min(palette_colors, 256))
+    if fixed_palette is not None:
+        palette_image = fixed_palette.palette_image()
+    elif quantizer == "tree":
+        palette_image = PaletteTree(grid).quantize(target_colors)
+    elif quantizer == "kmeans":
+        palette_image = PaletteRefiner(grid).quantize(target_colors)
+    else:
+        palette_image = grid.quantize(colors=target_colors, method=Image.ADAPTIVE)
+
+    def remap(strip, top):
+        if fixed_palette is not None:
+            return fixed_palette.quantize(strip, dither, origin=(0, top))
+        return dither_to_palette(strip, palette_image, dither, origin=(0, top))
+
+    # Every strip indexes the same palette, so it is bit-reduced once and the
+    # strips are written as indices
+    palette = color_bit_reduce(palette_image, bit_depth, bit_rounding).getpalette()
+
+    start = time.perf_counter()
+    strip_height = strip_height_for(grid, width, memory_budget)
+    with StreamingPNGWriter(
+        file_name, width, height, mode="P", palette=palette,
+        compress_level=compress_level, bit_depth=palette_bit_depth(len(palette) // 3),
+    ) as writer:
+        for top, strip in upscaled_strips(grid, width, height, strip_height):
+            writer.write_rows(remap(strip, top))
+
+    return export_report(file_name, preset, time.perf_counter() - start)
+
+
+def export_pixel_art_from_file(src_path, file_name, pixel_size, palette_colors,
+                               bit_depth, memory_budget=DEFAULT_EXPORT_MEMORY_BUDGET,
+                               quantizer="adaptive", dither="none", fixed_palette=None,
+                               preset="balanced", kernel="lanczos", aspect="square",
+                               bit_rounding="truncate", full_decode=False):
+    #Writes the on_grid pixel art for the image file src_path without ever
+    #holding a full-resolution image. The source is decoded only as large as
+    #the grid needs (JPEG DCT scaling, GRID_DECODE_OVERSAMPLE pixels per cell),
+    #all color work runs on the grid, and PNG output is NEAREST-upscaled to the
+    #original size and streamed row by row. Other formats have no streaming
+    #encoder here, so they get a single upscale of the finished grid.
+    #
+    #The output is not the same as apply_pixel_art_pipeline(..., on_grid=True)
+    #on a full decode. The DCT-scaled draft and the resample from it give
+    #slightly different cell colors, and the palette built from them drifts
+    #with them. On JPEGs that get scaled, a third to over half of the output
+    #pixels typically differ, by up to a few tens of levels. Images too small
+    #to scale come out identical. full_decode=True decodes at full size
+    #instead, which costs the full image's memory but gives exactly the
+    #pipeline's output.
+    #
+    #The format follows file_name's extension (indexed PNG, lossless WebP,
+    #GIF, ...) and preset picks its encoder options; returns the export_report.
+    if full_decode:
+        with Image.open(src_path) as src:
+            image = src.convert("RGB")
+        size = image.size
+    else:
+        image, size = load_preview_source(
+            src_path, 1, min_side=pixel_size * GRID_DECODE_OVERSAMPLE
+        )
+    grid = apply_pixel_art_pipeline(
+        image, pixel_size, palette_colors, bit_depth,
+        on_grid=True, upscale=False, quantizer=quantizer, dither=dither,
+        fixed_palette=fixed_palette, kernel=kernel, aspect=aspect,
+        bit_rounding=bit_rounding,
+    )
+    del image
+
+    if file_name.lower().endswith(".png"):
+        compress_level = png_compress_level(preset)
+        start = time.perf_counter()
+        write_upscaled_png(grid, file_name, size, memory_budget, compress_level)
+        return export_report(file_name, preset, time.perf_counter() - start)
+
+    return encode_image(upscale_grid(grid, size), file_name, preset)
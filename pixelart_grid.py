@@ -0,0 +1,96 @@
+# Grid resampling on a summed-area table.
+# Qt-free, like pixelart_core. Needs numpy, so pixelart_core only imports it
+# for the box and median kernels.
+
+import numpy as np
+from PIL import Image
+
+
+def block_edges(length, cells):
+    #Integer pixel boundaries of cells near-equal blocks along one axis
+    return (np.arange(cells + 1, dtype=np.int64) * length) // cells
+
+
+class GridSampler:
+    #Turns one source image into pixel-art grids of any size.
+    #Building it computes the summed-area table (integral image) of the
+    #source once. After that a "box" grid of any shape is a handful of gathers
+    #per cell, O(cells) whatever the source resolution, so scrubbing the pixel
+    #size never rescans the source. "lanczos" goes through Pillow and "median"
+    #sorts the source pixels by cell, so those two still cost O(pixels).
+    #
+    #The table is uint32 and may wrap around on big images; block sums are
+    #differences of table entries, so they stay exact modulo 2**32 and only
+    #need every single block (not the whole image) to stay below that. Blocks
+    #of MAX_TABLE_BLOCK_AREA pixels or more (grids of a cell or two on
+    #sources of about 17 MP and up) are summed from the pixels instead.
+
+    KERNELS = ("lanczos", "box", "median")
+
+    # Largest block whose sum of 8-bit values cannot wrap a uint32
+    MAX_TABLE_BLOCK_AREA = (2**32 - 1) // 255
+
+    def __init__(self, image):
+        self.image = image.convert("RGB")
+        self.size = self.image.size
+        self._pixels = np.asarray(self.image)
+
+        height, width = self._pixels.shape[:2]
+        table = np.zeros((height + 1, width + 1, 3), dtype=np.uint32)
+        np.cumsum(self._pixels, axis=0, dtype=np.uint32, out=table[1:, 1:])
+        np.cumsum(table[1:, 1:], axis=1, dtype=np.uint32, out=table[1:, 1:])
+        self._table = table
+
+    @property
+    def nbytes(self):
+        return self._table.nbytes + self._pixels.nbytes
+
+    def grid(self, grid_size, kernel="box"):
+        #The (columns, rows) grid of the source with the given kernel
+        if kernel == "lanczos":
+            return self.image.resize(grid_size, resample=Image.Resampling.LANCZOS)
+        if kernel == "box":
+            return self._box_grid(grid_size)
+        if kernel == "median":
+            return self._median_grid(grid_size)
+        raise ValueError(f"Unknown pixelation kernel: {kernel!r}")
+
+    def _box_grid(self, grid_size):
+        #Exact mean of every block, rounded to the nearest level
+        columns, rows = grid_size
+        width, height = self.size
+        xs = block_edges(width, columns)
+        ys = block_edges(height, rows)
+
+        table = self._table
+        x0, x1 = xs[:-1], xs[1:]
+        y0, y1 = ys[:-1, None], ys[1:, None]
+        areas = ((y1 - y0) * (x1 - x0))[..., None]
+        if areas.max() > self.MAX_TABLE_BLOCK_AREA:
+            # So few cells that one pass over the pixels is cheap
+            sums = np.add.reduceat(self._pixels, ys[:-1], axis=0, dtype=np.uint64)
+            sums = np.add.reduceat(sums, xs[:-1], axis=1, dtype=np.uint64)
+        else:
+            sums = table[y1, x1] - table[y0, x1] - table[y1, x0] + table[y0, x0]
+
+        means = (sums.astype(np.int64) * 2 + areas) // (areas * 2)
+        return Image.fromarray(means.astype(np.uint8), "RGB")
+
+    def _median_grid(self, grid_size):
+        #Per-channel median of every block (the lower one for even counts)
+        columns, rows = grid_size
+        width, height = self.size
+        column_of = np.repeat(np.arange(columns), np.diff(block_edges(width, columns)))
+        row_of = np.repeat(np.arange(rows), np.diff(block_edges(height, rows)))
+        cells = (row_of[:, None] * columns + column_of[None, :]).reshape(-1)
+
+        counts = np.bincount(cells, minlength=rows * columns)
+        middle = np.cumsum(counts) - counts + (counts - 1) // 2
+
+        # Sorting cell * 256 + value orders by cell, then by value within it
+        keys = cells.astype(np.int64) << 8
+        result = np.empty((rows * columns, 3), dtype=np.uint8)
+        for channel in range(3):
+            ordered = np.sort(keys | self._pixels[..., channel].reshape(-1))
+            result[:, channel] = ordered[middle] & 0xFF
+        return Image.fromarray(result.reshape(rows, columns, 3), "RGB")
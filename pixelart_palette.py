@@ -0,0 +1,799 @@
+# Palette building blocks that go beyond Pillow's one-shot quantize().
+# Qt-free, like pixelart_core.
+
+import heapq
+import json
+import os
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+
+from pixelart_core import drop_transparency
+
+
+def image_color_counts(image):
+    #Returns (colors, counts, inverse) for the distinct RGB colors of an image.
+    #colors is a (U, 3) uint8 array, counts how often each occurs and inverse
+    #maps every pixel (row-major) to its row in colors.
+    pixels = np.asarray(image.convert("RGB"), dtype=np.uint32).reshape(-1, 3)
+    keys = (pixels[:, 0] << 16) | (pixels[:, 1] << 8) | pixels[:, 2]
+    unique_keys, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+
+    colors = np.empty((len(unique_keys), 3), dtype=np.uint8)
+    colors[:, 0] = unique_keys >> 16
+    colors[:, 1] = (unique_keys >> 8) & 0xFF
+    colors[:, 2] = unique_keys & 0xFF
+    return colors, counts, inverse.reshape(-1)
+
+
+class ColorHistogram:
+    #The distinct colors of an image with their pixel counts, from one
+    #vectorized pass over packed 24-bit keys (see image_color_counts).
+    #An image with at most 256 colors maps onto it exactly, and a PaletteTree
+    #can be seeded from it instead of scanning the pixels again.
+
+    def __init__(self, image):
+        self.size = image.size
+        self.colors, self.counts, self.inverse = image_color_counts(image)
+
+    @classmethod
+    def combine(cls, histograms):
+        #One histogram over the colors of several images (e.g. the frames of
+        #an animation). It stands for an image with one pixel per distinct
+        #color, so it can seed a PaletteTree or PaletteRefiner but has no
+        #exact_image() worth using.
+        histograms = list(histograms)
+        colors = np.concatenate([histogram.colors for histogram in histograms])
+        counts = np.concatenate([histogram.counts for histogram in histograms])
+        keys = (
+            (colors[:, 0].astype(np.uint32) << 16)
+            | (colors[:, 1].astype(np.uint32) << 8)
+            | colors[:, 2]
+        )
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+
+        combined = cls.__new__(cls)
+        combined.colors = np.empty((len(unique_keys), 3), dtype=np.uint8)
+        combined.colors[:, 0] = unique_keys >> 16
+        combined.colors[:, 1] = (unique_keys >> 8) & 0xFF
+        combined.colors[:, 2] = unique_keys & 0xFF
+        combined.counts = np.bincount(inverse.reshape(-1), weights=counts).astype(np.int64)
+        combined.inverse = np.arange(len(unique_keys))
+        combined.size = (len(unique_keys), 1)
+        return combined
+
+    @property
+    def color_count(self):
+        return len(self.colors)
+
+    @property
+    def nbytes(self):
+        return self.colors.nbytes + self.counts.nbytes + self.inverse.nbytes
+
+    def exact_image(self):
+        #The image in P mode with one palette entry per distinct color
+        if self.color_count > 256:
+            raise ValueError(f"{self.color_count} colors do not fit in a palette")
+        image = Image.frombytes("P", self.size, self.inverse.astype(np.uint8).tobytes())
+        image.putpalette(self.colors.reshape(-1).tolist())
+        return image
+
+
+class PaletteTree:
+    #Median-cut split tree over the colors of one image.
+    #Building it runs every split up to max_colors leaves once. After that the
+    #palette for any size N comes from cutting the tree after its first N - 1
+    #splits, and quantize(N) is a single gather over the pixels, so scrubbing
+    #the palette slider never re-analyzes the image. The last MEMO_SIZE cuts are
+    #kept; older ones are cut again when asked for.
+    #Pass the image's ColorHistogram when one exists to skip its pixel scan.
+
+    MEMO_SIZE = 16
+
+    def __init__(self, image, max_colors=256, histogram=None):
+        if histogram is None:
+            histogram = ColorHistogram(image)
+        self.size = histogram.size
+        self.max_colors = max_colors
+
+        colors, counts, self._inverse = histogram.colors, histogram.counts, histogram.inverse
+        self._colors = colors.astype(np.float64)
+        self._counts = counts.astype(np.float64)
+
+        # Per node: parent id, split step that created it, step that split it
+        self._parent = []
+        self._born = []
+        self._split_at = []
+        self._mean = []
+
+        # Node each distinct color ends up in after the last split
+        self._leaf_of = np.zeros(len(colors), dtype=np.intp)
+
+        self._cut_cache = OrderedDict()
+        self._build()
+
+    @property
+    def color_count(self):
+        return len(self._colors)
+
+    @property
+    def nbytes(self):
+        # Charges a full memo up front so the StageCache size never goes stale
+        cut_bytes = self.max_colors * 3 + len(self._colors)
+        return (
+            self._inverse.nbytes + self._leaf_of.nbytes + self._colors.nbytes * 2
+            + self.MEMO_SIZE * cut_bytes
+        )
+
+    def _add_node(self, parent, step, indices):
+        weights = self._counts[indices]
+        mean = (self._colors[indices] * weights[:, None]).sum(axis=0) / weights.sum()
+        node = len(self._parent)
+        self._parent.append(parent)
+        self._born.append(step)
+        self._split_at.append(self.max_colors)
+        self._mean.append(mean)
+        self._leaf_of[indices] = node
+        return node
+
+    def _box_error(self, node, indices):
+        #Weighted squared error of the box around its mean: the split priority
+        diff = self._colors[indices] - self._mean[node]
+        return float((self._counts[indices] * (diff * diff).sum(axis=1)).sum())
+
+    def _build(self):
+        root_indices = np.arange(len(self._colors))
+        root = self._add_node(-1, 0, root_indices)
+        heap = [(-self._box_error(root, root_indices), root, root_indices)]
+
+        for step in range(1, self.max_colors):
+            if not heap:
+                break
+            neg_error, node, indices = heapq.heappop(heap)
+            if neg_error == 0.0:
+                # Every remaining box holds a single color
+                break
+
+            left, right = self._median_split(node, indices)
+            self._split_at[node] = step
+            for child_indices in (left, right):
+                child = self._add_node(node, step, child_indices)
+                heapq.heappush(
+                    heap, (-self._box_error(child, child_indices), child, child_indices)
+                )
+
+    def _median_split(self, node, indices):
+        #Cuts a box at the weighted median of its widest (highest variance) channel
+        colors = self._colors[indices]
+        weights = self._counts[indices]
+        diff = colors - self._mean[node]
+        channel = int(np.argmax((weights[:, None] * diff * diff).sum(axis=0)))
+
+        values = colors[:, channel]
+        order = np.argsort(values, kind="stable")
+        cumulative = np.cumsum(weights[order])
+        median = values[order[np.searchsorted(cumulative, cumulative[-1] / 2.0)]]
+
+        left_mask = values < median
+        if not left_mask.any():
+            left_mask = values <= median
+        return indices[left_mask], indices[~left_mask]
+
+    def _cut(self, n_colors):
+        #Maps every node to the node that stands for it with n_colors leaves
+        n_colors = max(1, min(n_colors, self.max_colors))
+        cut = self._cut_cache.get(n_colors)
+        if cut is not None:
+            self._cut_cache.move_to_end(n_colors)
+            return cut
+
+        last_step = n_colors - 1
+        representative = np.empty(len(self._parent), dtype=np.intp)
+        leaves = []
+        # Parents always have lower ids than their children
+        for node, parent in enumerate(self._parent):
+            if self._born[node] <= last_step:
+                representative[node] = node
+                if self._split_at[node] > last_step:
+                    leaves.append(node)
+            else:
+                representative[node] = representative[parent]
+
+        palette_index = np.zeros(len(self._parent), dtype=np.uint8)
+        palette_index[leaves] = np.arange(len(leaves), dtype=np.uint8)
+        palette = np.rint(np.array([self._mean[node] for node in leaves])).astype(np.uint8)
+
+        cut = (palette, palette_index[representative[self._leaf_of]])
+        self._cut_cache[n_colors] = cut
+        if len(self._cut_cache) > self.MEMO_SIZE:
+            self._cut_cache.popitem(last=False)
+        return cut
+
+    def palette(self, n_colors):
+        #The (<= n_colors, 3) uint8 palette after cutting the tree at n_colors leaves
+        return self._cut(n_colors)[0]
+
+    def assignment(self, n_colors):
+        #(palette, color_index): the palette for n_colors and the palette index
+        #of every distinct color of the histogram
+        return self._cut(n_colors)
+
+    def quantize(self, n_colors):
+        #Builds the P-mode image for n_colors by one lookup per pixel
+        palette, color_index = self._cut(n_colors)
+        indices = color_index[self._inverse]
+
+        image = Image.frombytes("P", self.size, indices.tobytes())
+        image.putpalette(palette.reshape(-1).tolist())
+        return image
+
+
+def nearest_centroids(colors, centroids, chunk=16384):
+    #Index of the nearest centroid (squared RGB distance) for every color.
+    #Works in chunks so the distance matrix stays a few MiB.
+    colors = np.asarray(colors, dtype=np.float32)
+    centroids = np.asarray(centroids, dtype=np.float32)
+    centroid_norms = (centroids * centroids).sum(axis=1)
+    labels = np.empty(len(colors), dtype=np.intp)
+    for start in range(0, len(colors), chunk):
+        block = colors[start:start + chunk]
+        # |x - c|^2 minus the |x|^2 term, which does not change the argmin
+        distances = centroid_norms - 2.0 * (block @ centroids.T)
+        labels[start:start + chunk] = distances.argmin(axis=1)
+    return labels
+
+
+class PaletteRefiner:
+    #Weighted k-means palettes over the colors of one image, warm-started from
+    #one palette size to the next.
+    #The first size asked for is seeded from a median-cut PaletteTree and
+    #refined with Lloyd iterations. Every later size starts from the nearest
+    #size already solved: growing splits the clusters with the largest error,
+    #shrinking merges the pairs that cost the least (Ward's criterion). A few
+    #iterations on a fixed sample of the colors then polish the centroids,
+    #stopping early once none moves by tolerance or more. A color keeps its
+    #cluster unless its own centroid changed or a changed one is now nearer,
+    #so neighboring sizes share most of their palette and of their pixels.
+    #The last MEMO_SIZE sizes are kept and reused, which keeps scrubbing back
+    #and forth over them stable; an older size is solved again from its nearest
+    #kept neighbor, so results depend on the order sizes are asked for.
+
+    MEMO_SIZE = 16
+
+    def __init__(self, image, max_colors=256, histogram=None, sample_size=4096,
+                 iterations=8, warm_iterations=3, tolerance=0.5, seed=205):
+        if histogram is None:
+            histogram = ColorHistogram(image)
+        self.size = histogram.size
+        self.max_colors = max_colors
+        self.iterations = iterations
+        self.warm_iterations = warm_iterations
+        self.tolerance = tolerance
+
+        self._inverse = histogram.inverse
+        self._histogram = histogram
+        self._colors = histogram.colors.astype(np.float32)
+        self._counts = histogram.counts.astype(np.float32)
+
+        # Lloyd iterations only look at this subset of the distinct colors
+        if len(self._colors) > sample_size:
+            rng = np.random.default_rng(seed)
+            self._sample = np.sort(rng.choice(len(self._colors), sample_size, replace=False))
+        else:
+            self._sample = np.arange(len(self._colors))
+
+        # n_colors -> (centroids, label of every distinct color), oldest first
+        self._solutions = OrderedDict()
+        self._last = None
+
+    @property
+    def color_count(self):
+        return len(self._colors)
+
+    @property
+    def nbytes(self):
+        # Charges a full memo up front so the StageCache size never goes stale
+        centroid_count = min(self.max_colors, self.color_count)
+        solution_bytes = (
+            centroid_count * 3 * self._colors.itemsize
+            + self.color_count * np.dtype(np.intp).itemsize
+        )
+        return (
+            self._inverse.nbytes + self._colors.nbytes + self._counts.nbytes
+            + self._sample.nbytes + len(self._colors) * np.dtype(np.intp).itemsize
+            + self.MEMO_SIZE * solution_bytes
+        )
+
+    def _solve(self, n_colors):
+        n_colors = max(1, min(n_colors, self.max_colors, self.color_count))
+        solution = self._solutions.get(n_colors)
+        if solution is not None:
+            self._solutions.move_to_end(n_colors)
+            return solution
+
+        if not self._solutions:
+            centroids, labels = self._seed(n_colors)
+            changed = np.ones(n_colors, dtype=bool)
+            iterations = self.iterations
+        else:
+            start = min(
+                self._solutions,
+                key=lambda size: (abs(size - n_colors), size != self._last),
+            )
+            centroids, labels = self._solutions[start]
+            centroids, labels = centroids.copy(), labels.copy()
+            changed = np.zeros(len(centroids), dtype=bool)
+            if n_colors > start:
+                centroids, labels, changed = self._split(centroids, labels, changed, n_colors)
+            elif n_colors < start:
+                centroids, labels, changed = self._merge(centroids, labels, changed, n_colors)
+            iterations = self.warm_iterations
+
+        centroids, moved = self._refine(centroids, iterations)
+        labels = self._reassign(centroids, labels, changed | moved)
+
+        solution = (centroids, labels)
+        self._solutions[n_colors] = solution
+        if len(self._solutions) > self.MEMO_SIZE:
+            self._solutions.popitem(last=False)
+        self._last = n_colors
+        return solution
+
+    def _seed(self, n_colors):
+        tree = PaletteTree(None, max_colors=n_colors, histogram=self._histogram)
+        palette, color_index = tree.assignment(n_colors)
+        return palette.astype(np.float32), color_index.astype(np.intp)
+
+    def _cluster_errors(self, centroids, labels):
+        #Weighted squared error of every cluster around its centroid
+        diff = self._colors - centroids[labels]
+        errors = self._counts * (diff * diff).sum(axis=1)
+        return np.bincount(labels, weights=errors, minlength=len(centroids))
+
+    def _split(self, centroids, labels, changed, n_colors):
+        #Splits the worst cluster at the weighted mean of its widest channel
+        #(see _split_side) until there are n_colors
+        errors = self._cluster_errors(centroids, labels)
+        centroids = list(centroids)
+        changed = list(changed)
+        while len(centroids) < n_colors:
+            worst = int(np.argmax(errors))
+            if errors[worst] <= 0.0:
+                # Every cluster is a single color; nothing left to split
+                break
+            members = np.flatnonzero(labels == worst)
+            colors, weights = self._colors[members], self._counts[members]
+            upper = self._split_side(colors, weights)
+            if upper is None:
+                # One color left behind a stale centroid; splitting cannot help
+                errors[worst] = 0.0
+                continue
+
+            new = len(centroids)
+            labels[members[upper]] = new
+            centroids.append(centroids[worst])
+            changed.append(True)
+            changed[worst] = True
+            errors = np.append(errors, 0.0)
+            for cluster, mask in ((worst, ~upper), (new, upper)):
+                part, part_weights = colors[mask], weights[mask]
+                centroids[cluster] = (
+                    (part * part_weights[:, None]).sum(axis=0) / part_weights.sum()
+                )
+                part_diff = part - centroids[cluster]
+                errors[cluster] = float((part_weights * (part_diff * part_diff).sum(axis=1)).sum())
+
+        centroids = np.array(centroids, dtype=np.float32)
+        return centroids, labels, np.array(changed, dtype=bool)
+
+    @staticmethod
+    def _split_side(colors, weights):
+        #Which members go above the weighted mean of their widest channel, or
+        #None if they are all one color. Both sides always get a member; when
+        #the mean rounds onto the edge of the range this falls back to the
+        #median, then to the farthest member.
+        if (colors == colors[0]).all():
+            return None
+        mean = (colors * weights[:, None]).sum(axis=0) / weights.sum()
+        diff = colors - mean
+        channel = int(np.argmax((weights[:, None] * diff * diff).sum(axis=0)))
+        upper = diff[:, channel] > 0
+        if not upper.any() or upper.all():
+            values = colors[:, channel]
+            upper = values > np.median(values)
+        if not upper.any() or upper.all():
+            upper = np.zeros(len(colors), dtype=bool)
+            upper[np.argmax((diff * diff).sum(axis=1))] = True
+        return upper
+
+    def _merge(self, centroids, labels, changed, n_colors):
+        #Merges the cheapest pair of clusters (Ward's criterion) until there
+        #are n_colors; the last cluster moves into the freed slot
+        weights = np.bincount(labels, weights=self._counts, minlength=len(centroids))
+        centroids = centroids.astype(np.float64)
+        while len(centroids) > n_colors:
+            diff = centroids[:, None, :] - centroids[None, :, :]
+            distances = (diff * diff).sum(axis=2)
+            pair_weights = weights[:, None] + weights[None, :]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                costs = np.where(
+                    pair_weights > 0,
+                    weights[:, None] * weights[None, :] / pair_weights * distances,
+                    0.0,
+                )
+            costs[np.tril_indices(len(centroids))] = np.inf
+            keep, gone = np.unravel_index(int(np.argmin(costs)), costs.shape)
+
+            total = weights[keep] + weights[gone]
+            if total > 0:
+                centroids[keep] = (
+                    centroids[keep] * weights[keep] + centroids[gone] * weights[gone]
+                ) / total
+            weights[keep] = total
+            labels[labels == gone] = keep
+            changed[keep] = True
+
+            last = len(centroids) - 1
+            if gone != last:
+                centroids[gone] = centroids[last]
+                weights[gone] = weights[last]
+                changed[gone] = changed[last]
+                labels[labels == last] = gone
+            centroids, weights, changed = centroids[:last], weights[:last], changed[:last]
+        return centroids.astype(np.float32), labels, changed
+
+    def _refine(self, centroids, iterations):
+        #Lloyd iterations on the sample; returns the centroids and which of them
+        #moved by tolerance or more in total
+        colors, weights = self._colors[self._sample], self._counts[self._sample]
+        start = centroids
+        for _ in range(iterations):
+            labels = nearest_centroids(colors, centroids)
+            totals = np.bincount(labels, weights=weights, minlength=len(centroids))
+            filled = totals > 0
+            updated = centroids.copy()
+            for channel in range(3):
+                sums = np.bincount(
+                    labels, weights=weights * colors[:, channel], minlength=len(centroids)
+                )
+                updated[filled, channel] = sums[filled] / totals[filled]
+            shift = float(np.abs(updated - centroids).max()) if len(centroids) else 0.0
+            centroids = updated
+            if shift < self.tolerance:
+                break
+        moved = np.abs(centroids - start).max(axis=1) >= self.tolerance
+        return centroids, moved
+
+    def _reassign(self, centroids, labels, changed):
+        #Nearest-centroid labels, recomputed only where a changed centroid can
+        #make a difference
+        if changed.all():
+            return nearest_centroids(self._colors, centroids)
+        changed_ids = np.flatnonzero(changed)
+        if len(changed_ids) == 0:
+            return labels
+
+        # Colors whose own centroid changed are matched against all of them
+        stale = changed[labels]
+        labels[stale] = nearest_centroids(self._colors[stale], centroids)
+
+        # The rest only against the changed ones
+        kept = np.flatnonzero(~stale)
+        colors = self._colors[kept]
+        own = colors - centroids[labels[kept]]
+        own_distances = (own * own).sum(axis=1)
+        candidates = changed_ids[nearest_centroids(colors, centroids[changed_ids])]
+        diff = colors - centroids[candidates]
+        closer = (diff * diff).sum(axis=1) < own_distances
+        labels[kept[closer]] = candidates[closer]
+        return labels
+
+    def palette(self, n_colors):
+        #The (<= n_colors, 3) uint8 palette refined for n_colors
+        centroids = self._solve(n_colors)[0]
+        return np.clip(np.rint(centroids), 0, 255).astype(np.uint8)
+
+    def quantize(self, n_colors):
+        #Builds the P-mode image for n_colors by one lookup per pixel
+        labels = self._solve(n_colors)[1]
+        indices = labels.astype(np.uint8)[self._inverse]
+
+        image = Image.frombytes("P", self.size, indices.tobytes())
+        image.putpalette(self.palette(n_colors).reshape(-1).tolist())
+        return image
+
+
+# Dithering onto a fixed palette
+
+ORDERED_DITHER_SIZES = {"bayer2": 2, "bayer4": 4, "bayer8": 8}
+
+BLUE_NOISE_SIZE = 64
+
+
+def palette_image(colors):
+    #Wraps an (N, 3) color list in the 1x1 P image Pillow's quantize() expects
+    image = Image.new("P", (1, 1))
+    image.putpalette(np.asarray(colors, dtype=np.uint8).reshape(-1).tolist())
+    return image
+
+
+def bayer_matrix(size):
+    #Classic recursive Bayer index matrix with values 0 .. size*size - 1
+    matrix = np.zeros((1, 1), dtype=np.int64)
+    while matrix.shape[0] < size:
+        matrix = np.block([
+            [4 * matrix, 4 * matrix + 2],
+            [4 * matrix + 3, 4 * matrix + 1],
+        ])
+    return matrix
+
+
+@lru_cache(maxsize=None)
+def threshold_map(dither):
+    #Returns a tile of thresholds in (-0.5, 0.5) for an ordered dither mode
+    if dither in ORDERED_DITHER_SIZES:
+        ranks = bayer_matrix(ORDERED_DITHER_SIZES[dither])
+    elif dither == "blue-noise":
+        ranks = _blue_noise_ranks(BLUE_NOISE_SIZE)
+    else:
+        raise ValueError(f"Not an ordered dither mode: {dither!r}")
+
+    levels = ranks.size
+    tile = (ranks.astype(np.float32) + 0.5) / levels - 0.5
+    tile.setflags(write=False)
+    return tile
+
+
+def _blue_noise_ranks(size, seed=205):
+    #Approximates a blue-noise tile by high-pass filtering white noise in the
+    #frequency domain and ranking the result. Deterministic and tileable.
+    rng = np.random.default_rng(seed)
+    noise = rng.random((size, size))
+
+    freq_y = np.fft.fftfreq(size)[:, None]
+    freq_x = np.fft.fftfreq(size)[None, :]
+    radius = np.sqrt(freq_x * freq_x + freq_y * freq_y)
+    high_pass = 1.0 - np.exp(-(radius / 0.18) ** 2)
+
+    filtered = np.real(np.fft.ifft2(np.fft.fft2(noise) * high_pass))
+    return np.argsort(np.argsort(filtered, axis=None)).reshape(size, size)
+
+
+def ordered_offsets(image, n_colors, dither, origin=(0, 0)):
+    #Nudges every pixel of an RGB image by its ordered-dither threshold, scaled
+    #to roughly one palette step per channel. origin is the image's offset in
+    #the full picture, which keeps the pattern seamless across strips.
+    spread = 255.0 / max(1.0, round(n_colors ** (1.0 / 3.0)))
+    tile = np.rint(threshold_map(dither) * spread).astype(np.int16)
+
+    # Roll the tile so (0, 0) of this image lines up with origin in the full picture
+    tile_h, tile_w = tile.shape
+    left, top = origin
+    tile = np.roll(tile, (-(top % tile_h), -(left % tile_w)), axis=(0, 1))
+
+    width, height = image.size
+    offsets = np.tile(tile, (-(-height // tile_h), -(-width // tile_w)))[:height, :width]
+
+    pixels = np.asarray(image.convert("RGB"), dtype=np.int16) + offsets[:, :, None]
+    np.clip(pixels, 0, 255, out=pixels)
+    return Image.fromarray(pixels.astype(np.uint8), "RGB")
+
+
+def ordered_dither(image, palette, dither, origin=(0, 0)):
+    #Ordered/blue-noise dithering of an RGB image onto a P-mode palette image.
+    #Every pixel is nudged by its threshold and then snapped to the nearest
+    #palette color, so unlike error diffusion each pixel is independent and
+    #the whole image is done in a few array operations.
+    n_colors = len(palette.getpalette()) // 3
+    nudged = ordered_offsets(image, n_colors, dither, origin)
+    return nudged.quantize(palette=palette, dither=Image.Dither.NONE)
+
+
+def dither_to_palette(image, palette, dither="none", origin=(0, 0)):
+    #Maps an image onto a P-mode palette image with the given dither mode and
+    #returns the P-mode result. "none" snaps each pixel to the nearest color.
+    image = image.convert("RGB")
+    if dither == "none":
+        return drop_transparency(image.quantize(palette=palette, dither=Image.Dither.NONE))
+    if dither == "floyd-steinberg":
+        return drop_transparency(
+            image.quantize(palette=palette, dither=Image.Dither.FLOYDSTEINBERG)
+        )
+    return ordered_dither(image, palette, dither, origin)
+
+
+# Fixed palettes
+
+# Well-known console palettes as 0xRRGGBB values
+BUILTIN_PALETTES = {
+    "pico-8": (
+        0x000000, 0x1D2B53, 0x7E2553, 0x008751, 0xAB5236, 0x5F574F, 0xC2C3C7, 0xFFF1E8,
+        0xFF004D, 0xFFA300, 0xFFEC27, 0x00E436, 0x29ADFF, 0x83769C, 0xFF77A8, 0xFFCCAA,
+    ),
+    "game-boy": (0x0F380F, 0x306230, 0x8BAC0F, 0x9BBC0F),
+    "nes": (
+        0x7C7C7C, 0x0000FC, 0x0000BC, 0x4428BC, 0x940084, 0xA80020, 0xA81000, 0x881400,
+        0x503000, 0x007800, 0x006800, 0x005800, 0x004058, 0x000000, 0xBCBCBC, 0x0078F8,
+        0x0058F8, 0x6844FC, 0xD800CC, 0xE40058, 0xF83800, 0xE45C10, 0xAC7C00, 0x00B800,
+        0x00A800, 0x00A844, 0x008888, 0xF8F8F8, 0x3CBCFC, 0x6888FC, 0x9878F8, 0xF878F8,
+        0xF85898, 0xF87858, 0xFCA044, 0xF8B800, 0xB8F818, 0x58D854, 0x58F898, 0x00E8D8,
+        0x787878, 0xFCFCFC, 0xA4E4FC, 0xB8B8F8, 0xD8B8F8, 0xF8B8F8, 0xF8A4C0, 0xF0D0B0,
+        0xFCE0A8, 0xF8D878, 0xD8F878, 0xB8F8B8, 0xB8F8D8, 0x00FCFC, 0xF8D8F8,
+    ),
+}
+
+
+def _hex_to_rgb(value):
+    return (value >> 16) & 0xFF, (value >> 8) & 0xFF, value & 0xFF
+
+
+# Palette artifacts: a palette picked in the GUI (or any pipeline run) saved
+# with the settings that produced it, so other runs can map onto it
+PALETTE_ARTIFACT_FORMAT = "pixelart-palette"
+PALETTE_ARTIFACT_EXTENSION = ".json"
+
+
+def read_palette_artifact(file_name):
+    #Reads a palette artifact written by FixedPalette.save() into a dict with
+    #"name", "colors" ((r, g, b) tuples) and "settings"
+    with open(file_name, encoding="utf-8") as artifact_file:
+        data = json.load(artifact_file)
+    if data.get("format") != PALETTE_ARTIFACT_FORMAT:
+        raise ValueError(f"{file_name} is not a {PALETTE_ARTIFACT_FORMAT} file")
+    return {
+        "name": data.get("name"),
+        "colors": [_hex_to_rgb(int(value.lstrip("#"), 16)) for value in data["colors"]],
+        "settings": data.get("settings", {}),
+    }
+
+
+def read_palette_file(file_name):
+    #Reads a palette file into a list of (r, g, b) tuples. Supports Lospec
+    #.hex (RRGGBB per line), Paint.NET .txt (AARRGGBB, ';' comments), GIMP
+    #.gpl and JASC .pal files.
+    with open(file_name, encoding="utf-8") as palette_file:
+        lines = [line.strip() for line in palette_file]
+    lines = [line for line in lines if line]
+
+    if lines and lines[0] == "GIMP Palette":
+        colors = []
+        for line in lines[1:]:
+            parts = line.split()
+            if line.startswith("#") or len(parts) < 3 or not parts[0].isdigit():
+                continue
+            colors.append(tuple(int(part) for part in parts[:3]))
+        return colors
+
+    if lines and lines[0] == "JASC-PAL":
+        # Header: magic, version, color count
+        return [tuple(int(part) for part in line.split()[:3]) for line in lines[3:]]
+
+    colors = []
+    for line in lines:
+        if line.startswith(";"):
+            continue
+        # Paint.NET entries carry a leading alpha byte
+        digits = line.lstrip("#")[-6:]
+        colors.append(_hex_to_rgb(int(digits, 16)))
+    return colors
+
+
+class FixedPalette:
+    #A fixed palette (console palette, palette file, ...) plus a lookup cube of
+    #nearest palette indices. The cube has 2**cube_bits bins per channel and is
+    #built once; mapping an image is then one table gather per pixel, so the
+    #same palette can be applied to any number of images. Lookups use each bin's
+    #center, so colors can be off by at most half a bin (2 levels at 6 bits).
+    #
+    #settings records how an adaptive palette was made (pixel size, quantizer,
+    #...) when the palette is an artifact of a pipeline run; save() and
+    #from_file() round-trip it as JSON.
+
+    def __init__(self, colors, name=None, cube_bits=6, settings=None):
+        colors = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)
+        # Drop duplicates but keep the file order
+        _, first = np.unique(colors, axis=0, return_index=True)
+        self.colors = colors[np.sort(first)]
+        if not 1 <= len(self.colors) <= 256:
+            raise ValueError("A fixed palette needs between 1 and 256 colors")
+
+        self.name = name
+        self.cube_bits = cube_bits
+        self.settings = dict(settings or {})
+        self._cube = None
+
+    @classmethod
+    def from_name(cls, name, cube_bits=6):
+        values = BUILTIN_PALETTES[name.lower()]
+        return cls([_hex_to_rgb(value) for value in values], name=name, cube_bits=cube_bits)
+
+    @classmethod
+    def from_file(cls, file_name, cube_bits=6):
+        name = os.path.splitext(os.path.basename(file_name))[0]
+        if file_name.lower().endswith(PALETTE_ARTIFACT_EXTENSION):
+            artifact = read_palette_artifact(file_name)
+            return cls(
+                artifact["colors"], name=artifact["name"] or name,
+                cube_bits=cube_bits, settings=artifact["settings"],
+            )
+        return cls(read_palette_file(file_name), name=name, cube_bits=cube_bits)
+
+    @classmethod
+    def from_image(cls, image, name=None, cube_bits=6, settings=None):
+        #The colors a P-mode image actually uses, in palette order
+        used = sorted(index for _, index in image.getcolors(256))
+        palette = image.getpalette()
+        colors = [palette[index * 3:index * 3 + 3] for index in used]
+        return cls(colors, name=name, cube_bits=cube_bits, settings=settings)
+
+    def save(self, file_name):
+        #Writes the palette and its settings as a JSON palette artifact
+        data = {
+            "format": PALETTE_ARTIFACT_FORMAT,
+            "version": 1,
+            "name": self.name,
+            "colors": [f"#{r:02x}{g:02x}{b:02x}" for r, g, b in self.colors.tolist()],
+            "settings": self.settings,
+        }
+        with open(file_name, "w", encoding="utf-8") as artifact_file:
+            json.dump(data, artifact_file, indent=2)
+            artifact_file.write("\n")
+
+    @property
+    def nbytes(self):
+        return self.colors.nbytes + (self._cube.nbytes if self._cube is not None else 0)
+
+    def palette_image(self):
+        return palette_image(self.colors)
+
+    def lookup_cube(self):
+        #The flat (2**cube_bits)**3 table of nearest palette indices, built on first use
+        if self._cube is None:
+            self._cube = self._build_cube()
+        return self._cube
+
+    def _build_cube(self):
+        bins = 1 << self.cube_bits
+        step = 256 // bins
+        centers = np.arange(bins, dtype=np.float32) * step + (step - 1) / 2.0
+        palette = self.colors.astype(np.float32)
+        palette_norms = (palette * palette).sum(axis=1)
+
+        # |c - p|^2 = |c|^2 - 2 c.p + |p|^2, and |c|^2 doesn't change the argmin.
+        # One red slice at a time keeps the distance matrix small.
+        green, blue = np.meshgrid(centers, centers, indexing="ij")
+        plane = np.stack([np.zeros(green.size, np.float32), green.ravel(), blue.ravel()], axis=1)
+        cube = np.empty(bins ** 3, dtype=np.uint8)
+        for red_bin, red in enumerate(centers):
+            plane[:, 0] = red
+            distances = palette_norms[None, :] - 2.0 * (plane @ palette.T)
+            cube[red_bin * bins * bins:(red_bin + 1) * bins * bins] = distances.argmin(axis=1)
+        return cube
+
+    def map_indices(self, image):
+        #Palette index of every pixel of an RGB image, via the lookup cube
+        bins = self.cube_bits
+        binned = np.asarray(image.convert("RGB")) >> (8 - bins)
+        keys = (
+            (binned[:, :, 0].astype(np.uint32) << (2 * bins))
+            | (binned[:, :, 1].astype(np.uint32) << bins)
+            | binned[:, :, 2]
+        )
+        return self.lookup_cube()[keys]
+
+    def quantize(self, image, dither="none", origin=(0, 0)):
+        #Maps an image onto this palette and returns a P-mode image
+        if dither == "floyd-steinberg":
+            # Error diffusion needs exact distances, so let Pillow do it
+            return drop_transparency(image.convert("RGB").quantize(
+                palette=self.palette_image(), dither=Image.Dither.FLOYDSTEINBERG
+            ))
+        if dither != "none":
+            image = ordered_offsets(image, len(self.colors), dither, origin)
+
+        indices = self.map_indices(image)
+        result = Image.frombytes("P", image.size, indices.tobytes())
+        result.putpalette(self.colors.reshape(-1).tolist())
+        return result
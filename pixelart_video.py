@@ -0,0 +1,275 @@
+# Streaming conversion of frame sequences (numbered PNG/JPEG frames exported
+# from video) with a palette reused from frame to frame.
+# Qt-free, like pixelart_core, and as cheap to import: Pillow and numpy load
+# on first use. Frames decode on one background thread and
+# encode on another, both behind bounded queues, so memory stays flat however
+# long the sequence is.
+#
+# Example:
+#   python pixelart_batch.py frames/ -o out --sequence --pixel-size 96 --colors 24
+
+import os
+import queue
+import re
+import threading
+import time
+
+from pixelart_core import (
+    StageCache,
+    apply_pixel_art_pipeline,
+    cached_grid,
+    lazy_import,
+    palette_artifact,
+    upscale_grid,
+)
+from pixelart_export import encode_image
+
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
+
+
+# Half the L1 distance between two frame signatures (0 = same colors,
+# 1 = nothing in common) past which a frame starts a new scene
+DEFAULT_SCENE_THRESHOLD = 0.3
+
+# Frames decoded ahead of the pipeline / converted frames waiting for the encoder
+DEFAULT_PREFETCH = 8
+DEFAULT_WRITE_QUEUE = 8
+
+# Bits per channel of the coarse histogram behind frame_signature
+SIGNATURE_BITS = 3
+
+# Marks the end of a queue
+_DONE = object()
+
+
+def natural_sort_key(path):
+    #Orders frame_2.png before frame_10.png
+    return [
+        int(part) if part.isdigit() else part.lower()
+        for part in re.split(r"(\d+)", os.path.basename(path))
+    ]
+
+
+def frame_signature(grid, bits=SIGNATURE_BITS):
+    #Normalized coarse color histogram of a pixel grid, 2**(3 * bits) bins
+    pixels = np.asarray(grid.convert("RGB")) >> (8 - bits)
+    keys = (
+        (pixels[..., 0].astype(np.intp) << (2 * bits))
+        | (pixels[..., 1].astype(np.intp) << bits)
+        | pixels[..., 2]
+    )
+    counts = np.bincount(keys.reshape(-1), minlength=1 << (3 * bits))
+    return counts / counts.sum()
+
+
+def signature_distance(signature, other):
+    #Share of the pixels that would have to change bins: 0.0 to 1.0
+    return 0.5 * float(np.abs(signature - other).sum())
+
+
+class SequenceError(Exception):
+    #Raised by stream_sequence when a frame fails to decode, convert or save.
+    #report has the keys of a finished run's report and counts the frames
+    #saved before the failure; the original error is the __cause__.
+
+    def __init__(self, message, report):
+        super().__init__(message)
+        self.report = report
+
+
+class FramePrefetcher:
+    #Iterates (path, RGB frame) pairs decoded on a background thread, at most
+    #depth frames ahead of the consumer. A decoding error is raised from the
+    #iterator; close() stops the thread early.
+
+    def __init__(self, files, depth=DEFAULT_PREFETCH):
+        self._queue = queue.Queue(maxsize=max(1, depth))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(list(files),), daemon=True)
+        self._thread.start()
+
+    def _run(self, files):
+        try:
+            for path in files:
+                with Image.open(path) as image:
+                    frame = image.convert("RGB")
+                if not self._put((path, frame)):
+                    return
+        except Exception as exc:
+            self._put(exc)
+            return
+        self._put(_DONE)
+
+    def _put(self, item):
+        # Gives up once the consumer has closed the prefetcher
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class QueuedFrameWriter:
+    #Encodes and saves frames on a background thread with encode_image.
+    #put() blocks while depth frames are already waiting. The first encoding
+    #error is raised from the next put() or from close().
+
+    def __init__(self, depth=DEFAULT_WRITE_QUEUE, preset="balanced"):
+        self.preset = preset
+        self.frames_written = 0
+        self.bytes = 0
+        self.encode_seconds = 0.0
+        self._error = None
+        self._queue = queue.Queue(maxsize=max(1, depth))
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            if self._error is not None:
+                # Keep draining so put() never blocks on a dead writer
+                continue
+            image, file_name = item
+            try:
+                report = encode_image(image, file_name, self.preset)
+            except Exception as exc:
+                self._error = exc
+                continue
+            self.frames_written += 1
+            self.bytes += report["bytes"]
+            self.encode_seconds += report["encode_seconds"]
+
+    def put(self, image, file_name):
+        if self._error is not None:
+            raise self._error
+        self._queue.put((image, file_name))
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(_DONE)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+
+def stream_sequence(jobs, pixel_size, palette_colors, bit_depth,
+                    scene_threshold=DEFAULT_SCENE_THRESHOLD, quantizer="tree",
+                    dither="none", fixed_palette=None, kernel="lanczos",
+                    aspect="square", preset="balanced", prefetch=DEFAULT_PREFETCH,
+                    write_queue=DEFAULT_WRITE_QUEUE, log=None, bit_rounding="truncate"):
+    #Converts a frame sequence; jobs are (source frame, output file) pairs in
+    #playback order. Every frame runs through apply_pixel_art_pipeline on the
+    #grid and is upscaled back to its own size.
+    #
+    #The palette is built on the first frame and then reused as a fixed
+    #palette (a remap only) for the frames after it. Each frame's grid is
+    #compared with the grid the palette was built on (frame_signature); once
+    #they are further apart than scene_threshold, the frame is quantized
+    #again, reusing the grid already in its StageCache, and its palette
+    #carries on. Measuring against the palette's own frame rather than the
+    #previous one also catches slow fades. A fixed_palette is used for every
+    #frame as is.
+    #
+    #log(path, seconds, new_palette) is called per frame. Returns {"frames"
+    #(frames saved), "palettes" (palettes built), "seconds",
+    #"frames_per_second", "bytes", "encode_seconds"}. The first error stops
+    #the run and is raised as a SequenceError carrying that report so far.
+    jobs = list(jobs)
+    options = {
+        "quantizer": quantizer, "dither": dither, "kernel": kernel, "aspect": aspect,
+        "bit_rounding": bit_rounding,
+    }
+
+    palette = fixed_palette
+    palette_signature = None
+    palettes = 0
+    error = None
+    start = time.perf_counter()
+
+    prefetcher = FramePrefetcher((path for path, _ in jobs), prefetch)
+    writer = QueuedFrameWriter(write_queue, preset)
+    try:
+        for (_, out_path), (path, frame) in zip(jobs, prefetcher):
+            frame_start = time.perf_counter()
+            # One cache per frame: it only carries the grid from the remap to
+            # a scene-change rebuild, and never keeps old frames alive
+            cache = StageCache()
+
+            if palette is not None:
+                result = apply_pixel_art_pipeline(
+                    frame, pixel_size, palette_colors, bit_depth, cache=cache,
+                    on_grid=True, upscale=False, fixed_palette=palette, **options,
+                )
+
+            new_palette = False
+            if fixed_palette is None:
+                if palette is None:
+                    new_palette = True
+                else:
+                    signature = frame_signature(
+                        cached_grid(cache, frame, pixel_size, kernel, aspect)
+                    )
+                    new_palette = (
+                        signature_distance(signature, palette_signature) > scene_threshold
+                    )
+                if new_palette:
+                    # Quantize afresh; the grid comes from the cache
+                    result = apply_pixel_art_pipeline(
+                        frame, pixel_size, palette_colors, bit_depth, cache=cache,
+                        on_grid=True, upscale=False, **options,
+                    )
+                    palette = palette_artifact(
+                        result, pixel_size=pixel_size, palette_colors=palette_colors,
+                        bit_depth=bit_depth, **options,
+                    )
+                    palette_signature = frame_signature(
+                        cached_grid(cache, frame, pixel_size, kernel, aspect)
+                    )
+                    palettes += 1
+
+            writer.put(upscale_grid(result, frame.size), out_path)
+            if log is not None:
+                log(path, time.perf_counter() - frame_start, new_palette)
+    except Exception as exc:
+        error = exc
+    finally:
+        prefetcher.close()
+        try:
+            writer.close()
+        except Exception as exc:
+            # An earlier decoding or pipeline error is the one to report
+            if error is None:
+                error = exc
+
+    seconds = time.perf_counter() - start
+    frames = writer.frames_written
+    report = {
+        "frames": frames,
+        "palettes": palettes,
+        "seconds": seconds,
+        "frames_per_second": frames / seconds if seconds > 0 else 0.0,
+        "bytes": writer.bytes,
+        "encode_seconds": writer.encode_seconds,
+    }
+    if error is not None:
+        raise SequenceError(str(error), report) from error
+    return report
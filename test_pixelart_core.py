@@ -0,0 +1,46 @@
+# Regression checks for pipeline output that has to save cleanly.
+#
+#   python -m pytest -q
+
+import pytest
+from PIL import Image, ImageDraw
+
+from pixelart_core import DITHER_MODES, apply_pixel_art_draft, apply_pixel_art_pipeline
+from pixelart_export import encode_image
+from pixelart_palette import FixedPalette
+
+
+@pytest.fixture
+def trns_source(tmp_path):
+    #An RGB PNG with a tRNS chunk, which Pillow reads back as
+    #info["transparency"] = (r, g, b)
+    image = Image.new("RGB", (97, 61), (0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((10, 5, 60, 40), fill=(200, 40, 30))
+    draw.ellipse((30, 20, 90, 58), fill=(20, 180, 220))
+    path = tmp_path / "trns.png"
+    image.save(path, transparency=(0, 0, 0))
+    with Image.open(path) as src:
+        source = src.convert("RGB")
+    assert isinstance(source.info.get("transparency"), tuple)
+    return source
+
+
+@pytest.mark.parametrize("extension", [".png", ".gif", ".webp"])
+@pytest.mark.parametrize("dither", DITHER_MODES)
+@pytest.mark.parametrize("on_grid", [False, True])
+@pytest.mark.parametrize("palette", [None, "pico-8"])
+def test_trns_source_saves(trns_source, tmp_path, extension, dither, on_grid, palette):
+    fixed_palette = FixedPalette.from_name(palette) if palette else None
+    result = apply_pixel_art_pipeline(
+        trns_source, 16, 8, 5, on_grid=on_grid, dither=dither, fixed_palette=fixed_palette,
+    )
+    assert "transparency" not in result.info
+    encode_image(result, str(tmp_path / f"out{extension}"))
+
+
+@pytest.mark.parametrize("palette", [None, "pico-8"])
+def test_trns_source_draft_saves(trns_source, tmp_path, palette):
+    fixed_palette = FixedPalette.from_name(palette) if palette else None
+    result = apply_pixel_art_draft(trns_source, 16, 8, 5, fixed_palette=fixed_palette)
+    encode_image(result, str(tmp_path / "draft.png"))
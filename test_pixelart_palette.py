@@ -0,0 +1,48 @@
+# Checks for the warm-started k-means palette.
+#
+#   python -m pytest -q
+
+import warnings
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from pixelart_palette import PaletteRefiner, PaletteTree
+
+
+@pytest.fixture(scope="module")
+def noise_grid():
+    #A grid where nearly every cell is its own color
+    pixels = np.random.default_rng(205).integers(0, 256, (32, 32, 3), dtype=np.uint8)
+    return Image.fromarray(pixels, "RGB")
+
+
+@pytest.mark.parametrize("sample_size", [64, 512])
+def test_refiner_sweep_keeps_every_centroid(noise_grid, sample_size):
+    # Scrubbing the size up and back down reuses and splits earlier solutions;
+    # a split that left one side empty used to average nothing into a NaN
+    # centroid, which rounds to an unused black entry
+    refiner = PaletteRefiner(noise_grid, sample_size=sample_size)
+    sizes = list(range(2, 257)) + list(range(255, 1, -1))
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", RuntimeWarning)
+        for n_colors in sizes:
+            centroids, labels = refiner._solve(n_colors)
+            assert np.isfinite(centroids).all(), n_colors
+            black = np.flatnonzero((refiner.palette(n_colors) == 0).all(axis=1))
+            assert np.isin(black, labels).all(), n_colors
+
+
+@pytest.mark.parametrize("palette_class", [PaletteTree, PaletteRefiner])
+def test_sweep_memo_stays_within_nbytes(noise_grid, palette_class):
+    # The StageCache charges these by nbytes once, when they are stored
+    palette = palette_class(noise_grid)
+    charged = palette.nbytes
+    for n_colors in range(2, 257):
+        palette.quantize(n_colors)
+    memo = palette._cut_cache if palette_class is PaletteTree else palette._solutions
+    held = sum(array.nbytes for entry in memo.values() for array in entry)
+    assert len(memo) == palette_class.MEMO_SIZE
+    assert palette.nbytes == charged
+    assert held <= charged